@@ -0,0 +1,165 @@
+# DocMD benchmark
+# Description: Build synthetic documentation trees with DocMD and report the cost of each build phase.
+# Usage: python3 bench_docmd.py --files 2000 --depth 3 --fanout 4 --output bench.json [--baseline old.json]
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import contextlib
+from pathlib import Path
+
+sys.path.append(os.path.dirname(__file__))
+import docmd
+
+BENCH_DIR = Path("bench_temp")
+WORDS = ("docmd", "markdown", "static", "site", "page", "folder", "index", "project", "build", "render",
+         "template", "navigation", "source", "output", "theme", "asset", "link", "header", "section", "list")
+
+# Folders of a project tree with the given depth and fan-out.
+def get_tree_folders(depth, fanout):
+    folders = [Path(".")]
+    level = [Path(".")]
+    for depth_index in range(depth):
+        level = [folder / f"dir{depth_index}_{i}" for folder in level for i in range(fanout)]
+        folders.extend(level)
+    return folders
+
+# Markdown content of roughly the given size.
+def get_markdown_content(title, size, rng):
+    parts = [f"# {title}\n"]
+    length = len(parts[0])
+    while length < size:
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 30)))
+        kind = rng.randint(0, 5)
+        if kind == 0:
+            block = f"\n## {words[:40].title()}\n"
+        elif kind == 1:
+            block = "\n" + "".join(f"- {word}\n" for word in words.split()[:6])
+        elif kind == 2:
+            block = f"\n```\n{words}\n```\n"
+        else:
+            block = f"\n{words.capitalize()}, with *emphasis* and a [link](index.md).\n"
+        parts.append(block)
+        length += len(block)
+    return "".join(parts)
+
+def generate_tree(root, files=1000, depth=3, fanout=4, file_size=2048, projects=1, seed=0):
+    """ Generate a synthetic docs tree and return its INCLUDE_PATHS."""
+    rng = random.Random(seed)
+    root = Path(root)
+    folders = get_tree_folders(depth, fanout)
+    include_paths = []
+    for project_index in range(projects):
+        project_path = root / f"project{project_index}"
+        project_files = files // projects + (1 if project_index < files % projects else 0)
+        for file_index in range(project_files):
+            folder = project_path / folders[file_index % len(folders)]
+            folder.mkdir(parents=True, exist_ok=True)
+            title = f"page{project_index}_{file_index}"  # Projects share the output root.
+            (folder / f"{title}.md").write_text(get_markdown_content(title, file_size, rng), encoding="utf-8")
+        project_path.mkdir(parents=True, exist_ok=True)
+        include_paths.append({"path": str(project_path), "name": f"Project{project_index}", "excludes": []})
+    return include_paths
+
+def get_dir_size(directory):
+    return sum(entry.stat().st_size for entry in Path(directory).rglob("*") if entry.is_file())
+
+def run_benchmark(include_paths, output_dir, jobs=1):
+    """ Build a site with DocMD and return the wall time, peak RSS and output bytes of each phase."""
+    output_dir = Path(output_dir)
+    phases = []
+    def on_phase(phase):
+        phases.append(dict(phase, output_bytes=get_dir_size(output_dir) if output_dir.exists() else 0))
+    settings = {
+        "INCLUDE_PATHS": include_paths,
+        "OUTPUT_DIR": output_dir,
+        "SAVE_DIR": output_dir,
+        "BACKUP_DIR": output_dir.parent / "archives",
+        "JOBS": str(jobs),
+    }
+    previous = {name: getattr(docmd, name) for name in settings}
+    for name, value in settings.items():
+        setattr(docmd, name, value)
+    docmd.PHASE_LISTENERS.append(on_phase)
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            docmd.generate_site()
+    finally:
+        total_seconds = time.perf_counter() - start
+        docmd.PHASE_LISTENERS.remove(on_phase)
+        for name, value in previous.items():
+            setattr(docmd, name, value)
+    return {
+        "total_seconds": total_seconds,
+        "peak_rss_kb": docmd.get_max_rss_kb(),
+        "output_bytes": get_dir_size(output_dir),
+        "pages": sum(1 for _ in output_dir.rglob("*.html")),
+        "phases": phases,
+    }
+
+def compare_results(results, baseline, threshold=0.2):
+    """ List the timings that regressed by more than the threshold against a baseline."""
+    regressions = []
+    def check(name, current, previous):
+        if previous and current > previous * (1 + threshold):
+            regressions.append({"name": name, "baseline": previous, "current": current, "ratio": current / previous})
+    check("total_seconds", results["total_seconds"], baseline.get("total_seconds"))
+    baseline_phases = {phase["name"]: phase for phase in baseline.get("phases", [])}
+    for phase in results["phases"]:
+        if phase["name"] in baseline_phases:
+            check(f"{phase['name']}.seconds", phase["seconds"], baseline_phases[phase["name"]].get("seconds"))
+    return regressions
+
+def print_results(results):
+    # The peak RSS is cumulative (the process peak at the end of the phase), the growth is how much the phase raised it.
+    print(f" {'phase':<12} {'seconds':>9} {'peak rss (KB)':>14} {'growth (KB)':>12} {'output bytes':>13}")
+    for phase in results["phases"]:
+        print(f" {phase['name']:<12} {phase['seconds']:>9.3f} {phase['peak_rss_kb'] or 0:>14} {phase['rss_growth_kb'] or 0:>12} {phase['output_bytes']:>13}")
+    print(f" {'total':<12} {results['total_seconds']:>9.3f} {results['peak_rss_kb'] or 0:>14} {'':>12} {results['output_bytes']:>13}")
+    print(f" {results['pages']} pages generated.")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark DocMD builds on synthetic documentation trees.")
+    parser.add_argument("--files", type=int, default=1000, help="Number of Markdown files.")
+    parser.add_argument("--depth", type=int, default=3, help="Depth of the folder tree.")
+    parser.add_argument("--fanout", type=int, default=4, help="Sub-folders per folder.")
+    parser.add_argument("--file-size", type=int, default=2048, help="Approximate size of each file, in bytes.")
+    parser.add_argument("--projects", type=int, default=1, help="Number of INCLUDE_PATHS projects.")
+    parser.add_argument("--jobs", default="1", help="Worker processes used by DocMD ('auto' for all CPU cores).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the content generator.")
+    parser.add_argument("--output", help="Save the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with the results of a previous run.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown ratio flagged as a regression.")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated tree and site.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if BENCH_DIR.exists():
+        shutil.rmtree(BENCH_DIR)
+    include_paths = generate_tree(BENCH_DIR / "src", args.files, args.depth, args.fanout, args.file_size, args.projects, args.seed)
+    try:
+        results = run_benchmark(include_paths, BENCH_DIR / "docs", args.jobs)
+    finally:
+        if not args.keep:
+            shutil.rmtree(BENCH_DIR, ignore_errors=True)
+    results["config"] = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "keep")}
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_results(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f" Regression: {regression['name']} {regression['baseline']:.3f}s -> {regression['current']:.3f}s (x{regression['ratio']:.2f})")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
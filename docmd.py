@@ -11,13 +11,61 @@ from pathlib import Path
 import markdown
 import jinja2
 import shutil
-from datetime import datetime
+from datetime import datetime, timezone
 from urllib.parse import quote
 import json
 import html
+from html.parser import HTMLParser
 import re
 from unidecode import unidecode
 import hashlib
+import unicodedata
+import time
+import sys
+import argparse
+import cProfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict, deque
+from itertools import islice, chain
+from contextlib import suppress, contextmanager
+import queue
+import filecmp
+import threading
+import socket
+import select
+import struct
+import ctypes
+import functools
+import http.server
+import io
+import gzip
+import bz2
+import lzma
+import tarfile
+import zipfile
+from functools import lru_cache
+from fnmatch import fnmatch
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+try:
+    import zstandard
+except ImportError:  # Only needed for .tar.zst archives and .zst precompressed outputs.
+    zstandard = None
+try:
+    import brotli
+except ImportError:  # Only needed for .br precompressed outputs.
+    brotli = None
+try:
+    import rjsmin
+except ImportError:  # Only needed to minify scripts.
+    rjsmin = None
+try:
+    import fcntl
+except ImportError:  # Not available on Windows.
+    fcntl = None
 
 # Environment setup
 load_dotenv()
@@ -34,6 +82,10 @@ def get_paths(string):
         paths.append(Path(base_path))
     return paths
 
+# Utility to expand a path starting with ~
+def get_user_path(string):
+    return Path(os.path.expanduser(string))
+
 # Utility to split and strip a comma-separated string
 def get_config_array(string):
     return list(map(str.strip, string.split(',')))
@@ -44,14 +96,31 @@ def clean_lang(lang_str):
     base_lang = lang_str.split(".")[0].replace("_", "-")
     return base_lang
 
-# Environnement Jinja2 global
-JINJA_ENV = jinja2.Environment(loader=jinja2.FileSystemLoader('templates'))
-
 # Filtre personnalisé
 def has_active_subpage(sub_pages, current_page):
     return any(sub["rel_path"] == current_page for sub in sub_pages)
 
-JINJA_ENV.filters['has_active_subpage'] = has_active_subpage
+# Jinja2 bytecode cache, so that repeated runs skip the template compilation
+def get_bytecode_cache():
+    if BYTECODE_CACHE == 'False':
+        return None
+    cache_dir = CACHE_DIR / "jinja"
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        print(f" Warning: Could not create the template cache '{cache_dir}': {e}")
+        return None
+    return jinja2.FileSystemBytecodeCache(str(cache_dir))
+
+# Create a Jinja2 environment
+def create_jinja_env(template_dirs):
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dirs), bytecode_cache=get_bytecode_cache())
+    env.filters['has_active_subpage'] = has_active_subpage
+    return env
+
+def get_footer(date_tag_human, label="Document generated on"):
+    footer = f"Powered by <a href=\"{APP_URL}\" target=\"_blank\">{APP_NAME}</a>"
+    return f"{footer}<br /><small>{label} {date_tag_human}</small>" if date_tag_human else footer
 
 def get_debug_status():
   debug_default = True if ENV == "dev" else False
@@ -66,14 +135,88 @@ EXCLUDE_PATHS = get_paths(os.environ.get("EXCLUDE_PATHS", ".git,.hg"))
 SAVE_DIR = Path(os.environ.get("SAVE_DIR", "docs"))
 OUTPUT_DIR = Path(os.environ.get("OUTPUT_DIR", "docs"))
 TEMPLATE = os.environ.get("TEMPLATE", "default.html")
-BACKUP_DIR = Path(os.path.expanduser(os.getenv("BACKUP_DIR", "~/.docmd/archives")))
-DATE_TAG = datetime.now().strftime("%Y%m%d-%H%M%S")
-DATE_TAG_HUMAN = datetime.now().strftime("%Y-%m-%d at %H:%M:%S")
+BACKUP_DIR = get_user_path(os.getenv("BACKUP_DIR", "~/.docmd/archives"))
+BACKUP_KEEP = os.environ.get("BACKUP_KEEP", "10")
+BACKUP_MAX_AGE_DAYS = os.environ.get("BACKUP_MAX_AGE_DAYS", "0")
+# Reproducible builds set SOURCE_DATE_EPOCH, used for the generation date and the archive timestamps.
+SOURCE_DATE_EPOCH = os.environ.get("SOURCE_DATE_EPOCH", "")
+BUILD_DATE = datetime.fromtimestamp(int(SOURCE_DATE_EPOCH), timezone.utc) if SOURCE_DATE_EPOCH else datetime.now()
+DATE_TAG = BUILD_DATE.strftime("%Y%m%d-%H%M%S")
+DATE_TAG_HUMAN = BUILD_DATE.strftime("%Y-%m-%d at %H:%M:%S")
+# Reproducible output dates each page with its sources, and the build in BUILD_INFO_FILE only.
+REPRODUCIBLE = os.environ.get("REPRODUCIBLE", "False")
+BUILD_INFO_FILE = "build-info.json"
 ROOT_INDEX_TITLE = os.environ.get("ROOT_INDEX_TITLE", "Documentation Home")
 ROOT_INDEX_SUB_TITLE = os.environ.get("ROOT_INDEX_SUB_TITLE", "Welcome to the Documentation")
 ROOT_INDEX_PROJECT_NAME = os.environ.get("ROOT_INDEX_PROJECT_NAME", "Root")
 ROOT_DISPLAY_MENU = os.environ.get("ROOT_DISPLAY_MENU", "True")
 ROOT_SPLASH_PAGE = os.environ.get("ROOT_SPLASH_PAGE", "False")
+INCREMENTAL = os.environ.get("INCREMENTAL", "False")
+JOBS = os.environ.get("JOBS", "1")
+NAV_MODE = os.environ.get("NAV_MODE", "embedded")
+CACHE_DIR = get_user_path(os.getenv("CACHE_DIR", "~/.docmd/cache"))
+SCAN_CACHE = os.environ.get("SCAN_CACHE", "False")
+SCAN_CACHE_VERSION = 1
+SCAN_CACHE_RACY_WINDOW = 2 * 10**9
+RESCAN = os.environ.get("RESCAN", "False")
+MARKDOWN_EXTENSIONS = os.environ.get("MARKDOWN_EXTENSIONS", "")
+MARKDOWN_EXTENSION_CONFIGS = os.environ.get("MARKDOWN_EXTENSION_CONFIGS", "")
+FRAGMENT_CACHE = os.environ.get("FRAGMENT_CACHE", "False")
+FRAGMENT_CACHE_VERSION = 1
+FRAGMENT_MEMORY_CACHE = int(os.environ.get("FRAGMENT_MEMORY_CACHE", "0"))
+BYTECODE_CACHE = os.environ.get("BYTECODE_CACHE", "False")
+QUIET = os.environ.get("QUIET", "False")
+PROGRESS_INTERVAL = 0.5
+BUILD_REPORT = os.environ.get("BUILD_REPORT", "")
+PROFILE = os.environ.get("PROFILE", "")
+WRITERS = int(os.environ.get("WRITERS", "2"))
+WRITE_QUEUE_DEPTH = int(os.environ.get("WRITE_QUEUE_DEPTH", "32"))
+PREFETCH_DEPTH = int(os.environ.get("PREFETCH_DEPTH", "8"))
+TASK_BATCH_SIZE = 64
+SYNC_OUTPUT = os.environ.get("SYNC_OUTPUT", "False")
+SHARD = os.environ.get("SHARD", "")
+MERGE_SHARDS = os.environ.get("MERGE_SHARDS", "")
+ARCHIVE = os.environ.get("ARCHIVE", "")
+ARCHIVE_DEFAULT_MTIME = 315532800  # 1980-01-01, the oldest date of a zip member.
+ARCHIVE_MTIME = int(SOURCE_DATE_EPOCH or ARCHIVE_DEFAULT_MTIME)
+PRECOMPRESS = os.environ.get("PRECOMPRESS", "False")
+PRECOMPRESS_MIN_SIZE = int(os.environ.get("PRECOMPRESS_MIN_SIZE", "1024"))
+PRECOMPRESS_LEVELS = {"gz": 9, "br": 6, "zst": 10}  # Past these levels pages shrink by ~1% for 3x the time (50x for brotli 11).
+PRECOMPRESS_TYPES = (".html", ".css", ".js", ".json", ".svg")
+ASSET_LINKS = os.environ.get("ASSET_LINKS", "True")
+ASSET_FINGERPRINT = os.environ.get("ASSET_FINGERPRINT", "False")
+ASSET_FINGERPRINT_TYPES = (".css", ".js")
+MINIFY_ASSETS = os.environ.get("MINIFY_ASSETS", "False")
+MAX_FILE_SIZE = int(os.environ.get("MAX_FILE_SIZE", str(50 * 1024 * 1024)))
+MAX_FILE_POLICIES = ('pre', 'copy', 'skip')
+
+# Page of the files larger than MAX_FILE_SIZE, rejected when unknown rather than falling back to skip.
+def parse_max_file_policy(value):
+    policy = value.strip().lower()
+    if policy not in MAX_FILE_POLICIES:
+        raise ValueError(f"Invalid MAX_FILE_POLICY '{value}', expected {', '.join(MAX_FILE_POLICIES)}.")
+    return policy
+
+MAX_FILE_POLICY = parse_max_file_policy(os.environ.get("MAX_FILE_POLICY", "pre"))
+CONVERT_TIMEOUT = float(os.environ.get("CONVERT_TIMEOUT", "0"))
+CONVERT_GUARD_START_TIMEOUT = 60
+FOLDER_INDEX_PAGE_SIZE = int(os.environ.get("FOLDER_INDEX_PAGE_SIZE", "0"))
+FOLDER_INDEX_LAYOUT = os.environ.get("FOLDER_INDEX_LAYOUT", "list")
+DAEMON_SOCKET = get_user_path(os.environ.get("DAEMON_SOCKET", "~/.docmd/docmd.sock"))
+DAEMON_FRAGMENT_MEMORY_CACHE = 4096
+WATCH_PORT = int(os.environ.get("WATCH_PORT", "8000"))
+WATCH_POLL = os.environ.get("WATCH_POLL", "False")
+WATCH_INTERVAL = float(os.environ.get("WATCH_INTERVAL", "0.5"))
+SEARCH = os.environ.get("SEARCH", "False")
+SEARCH_PATH = 'static/search'
+SEARCH_CACHE_FILE = ".docmd-search.json"
+SEARCH_CACHE_VERSION = 2
+SEARCH_PREFIX_LENGTH = 2  # Shard names stay clear of reserved file names such as con or aux.
+SEARCH_WEIGHTS = {"text": 1, "heading": 5, "title": 10}
+SEARCH_ACCENTS = re.compile("[\u0300-\u036f]")  # Combining accents left by the NFKD normalisation, dropped like in script.js.
+MANIFEST_FILE = ".docmd-manifest.json"
+MANIFEST_VERSION = 3
+HASH_CHUNK_SIZE = 1024 * 1024
 
 # Variables.
 APP_NAME = 'DocMD'
@@ -84,18 +227,27 @@ APP_AUTHOR = APP_NAME
 NAV_TITLE = os.environ.get("NAV_TITLE", "Documentation")
 ASSETS_PATH = 'static'
 CSS_PATH = 'static/css/style.css'
+NAV_SCRIPT_PATH = 'static/js/nav.js'
 THEMES = {'default', 'dark'}
 THEME = os.environ.get("THEME", "default")
 THEME_MODE = 'dark' if THEME == 'dark' else 'light'
-FOOTER = f"Powered by <a href=\"{APP_URL}\" target=\"_blank\">{APP_NAME}</a><br /><small>Document generated on {DATE_TAG_HUMAN}</small>"
+FOOTER = get_footer(DATE_TAG_HUMAN)
 USE_EXTERNAL_ASSETS = os.environ.get("USE_EXTERNAL_ASSETS", 'False')
 BS_CSS_URL = "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css"
 BS_CSS_PATH = 'static/css/bootstrap.min.css'
+ASSET_MANIFEST_PATH = 'static/assets.json'
+ASSET_MANIFEST = {}  # Fingerprinted names of the static assets of the build, by path relative to static/.
+ASSET_VERSIONS = {}  # Content hashes of the assets generated by the build, by path relative to static/.
+
+# Environnement Jinja2 global
+JINJA_ENV = create_jinja_env('templates')
 
 # Utility to parse INCLUDE_PATHS as string or JSON list of dicts
-def parse_include_paths(env_value):
+def parse_include_paths(env_value, exclude_paths=None):
+    if exclude_paths is None:
+        exclude_paths = EXCLUDE_PATHS
     if not env_value:
-        return [{"path": "src", "name": "Source", "excludes": EXCLUDE_PATHS}]
+        return [{"path": "src", "name": "Source", "excludes": exclude_paths}]
     try:
         # Si c’est un JSON (liste de dicts)
         parsed = json.loads(env_value)
@@ -104,21 +256,154 @@ def parse_include_paths(env_value):
                 {
                     "path": p if isinstance(p, str) else p.get("path", "src"),
                     "name": p.get("name", Path(p["path"]).name) if isinstance(p, dict) else Path(p).name,
-                    "excludes": get_paths(p.get("excludes", "")) if isinstance(p, dict) else EXCLUDE_PATHS
+                    "excludes": get_paths(p.get("excludes", "")) if isinstance(p, dict) else exclude_paths
                 }
                 for p in parsed
             ]
     except json.JSONDecodeError:
         # Si c’est une string simple (ancien format)
-        return [{"path": p, "name": Path(p).name, "excludes": EXCLUDE_PATHS} for p in get_config_array(env_value)]
-    return [{"path": "src", "name": "Source", "excludes": EXCLUDE_PATHS}]
+        return [{"path": p, "name": Path(p).name, "excludes": exclude_paths} for p in get_config_array(env_value)]
+    return [{"path": "src", "name": "Source", "excludes": exclude_paths}]
 
 INCLUDE_PATHS = parse_include_paths(os.environ.get("INCLUDE_PATHS", "src"))
 
-# Check if a file path should be excluded
-def should_exclude(file_path, exclude_paths):
-    """ Check if a file or folder should be excluded."""
-    return any(excluded in file_path.parents or file_path == excluded for excluded in exclude_paths)
+# Precompile exclusions into a set of literal paths and a tuple of glob patterns.
+def compile_excludes(exclude_paths):
+    """ Compile exclude paths for constant-time lookups while walking."""
+    literals = set()
+    patterns = []
+    for excluded in exclude_paths:
+        excluded = str(excluded).strip()
+        if excluded in ("", "."):
+            continue  # An empty setting must not exclude everything.
+        if any(char in excluded for char in "*?["):
+            patterns.append(excluded)
+        else:
+            literals.add(os.path.normpath(excluded))
+    return literals, tuple(patterns)
+
+def is_excluded(path, name, excludes):
+    literals, patterns = excludes
+    return path in literals or any(fnmatch(path, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+# Page of the hierarchy: a Markdown file or a folder index.
+class Page:
+    """ Compact page record, read as page.title by templates or page["title"] by the build.
+
+    A single record per Markdown file is shared by the scan results and the hierarchy.
+    Folders list their files in sub_pages, and each file keeps the position of its folder
+    in the hierarchy as parent_index (-1 until it is placed).
+    """
+    __slots__ = ("title", "rel_path", "target_path", "is_folder", "project", "sub_pages", "parent_index")
+    FIELDS = ("title", "rel_path", "target_path", "is_folder", "project", "sub_pages")
+
+    def __init__(self, title, rel_path, target_path, is_folder, project, sub_pages=None, parent_index=-1):
+        self.title = title
+        self.rel_path = rel_path
+        self.target_path = target_path
+        self.is_folder = is_folder
+        self.project = project
+        self.sub_pages = sub_pages if sub_pages is not None else ([] if is_folder else ())
+        self.parent_index = parent_index
+
+    # Source file of a Markdown page, rebuilt on demand rather than kept as a Path.
+    @property
+    def file_path(self):
+        return Path(self.target_path)
+
+    # Folder of a Markdown page relative to its project (None at the project root).
+    @property
+    def parent(self):
+        return os.path.dirname(self.rel_path) or None
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if isinstance(key, str) else default
+
+    def __eq__(self, other):
+        if not isinstance(other, Page):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.FIELDS)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Page({self.rel_path!r}, project={self.project!r})"
+
+# List a folder: its Markdown file names and sub-folders, once exclusions are applied.
+def list_source_dir(root, excludes):
+    with os.scandir(root) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    file_names = []
+    sub_dirs = []
+    for entry in entries:
+        if is_excluded(os.path.normpath(entry.path), entry.name, excludes):
+            continue
+        if entry.is_dir():
+            if not entry.is_symlink():
+                sub_dirs.append(entry.path)
+        elif entry.name.endswith(".md"):
+            file_names.append(entry.name)
+    return file_names, sub_dirs
+
+# Walk a project with os.scandir, pruning excluded folders before descending.
+def iter_project_markdown_files(project, global_exclude_paths, scan_cache=None):
+    """ Yield the Markdown files of a project as they are found.
+
+    With a scan cache, folders whose mtime did not move reuse their previous listing
+    and the cache is updated in place once the walk completes.
+    """
+    base_path = Path(project["path"])
+    project_name = sys.intern(project["name"])
+    excludes = compile_excludes(list(project["excludes"]) + list(global_exclude_paths))
+    if any(is_excluded(str(path), path.name, excludes) for path in [base_path, *base_path.parents]):
+        return
+    cached_dirs = scan_cache.get("dirs", {}) if scan_cache is not None else {}
+    scanned_dirs = {}
+    racy_limit = time.time_ns() - SCAN_CACHE_RACY_WINDOW
+    stack = [str(base_path)]
+    while stack:
+        root = stack.pop()
+        try:
+            mtime = os.stat(root).st_mtime_ns
+            cached = cached_dirs.get(root)
+            if cached and cached["mtime"] == mtime:
+                file_names, sub_dirs = cached["files"], cached["dirs"]
+            else:
+                file_names, sub_dirs = list_source_dir(root, excludes)
+        except OSError as e:
+            print(f" Warning: Could not scan '{root}': {e}")
+            continue
+        # A folder modified within the mtime resolution could change again unnoticed.
+        if scan_cache is not None and mtime < racy_limit:
+            scanned_dirs[root] = {"mtime": mtime, "files": file_names, "dirs": sub_dirs}
+        root_path = Path(root)
+        parent = sys.intern(str(root_path.relative_to(base_path))) if root_path != base_path else ""
+        root_dir = str(root_path) if str(root_path) != "." else ""
+        for file_name in file_names:
+            title = os.path.splitext(file_name)[0]
+            yield Page(title, os.path.join(parent, title + ".html"), os.path.join(root_dir, file_name), False, project_name)
+        stack.extend(reversed(sub_dirs))
+    if scan_cache is not None:
+        scan_cache["dirs"] = scanned_dirs
+
+# Scan caches loaded by this process, kept for the next builds of a daemon.
+SCAN_CACHES = {}
+
+# Scan cache file of a project, keyed on its location and exclusions.
+def get_scan_cache_file(project, global_exclude_paths):
+    excludes = sorted(str(e) for e in list(project["excludes"]) + list(global_exclude_paths))
+    key = get_fingerprint([SCAN_CACHE_VERSION, os.path.abspath(project["path"]), excludes])
+    return CACHE_DIR / "scan" / f"{key}.json"
+
+def iter_markdown_files(projects, global_exclude_paths):
+    for project in projects:
+        yield from iter_project_markdown_files(project, global_exclude_paths)
 
 # Scan for Markdown files and build hierarchy
 def scan_markdown_files(projects, global_exclude_paths):
@@ -127,275 +412,763 @@ def scan_markdown_files(projects, global_exclude_paths):
 
     for project in projects:
         base_path = Path(project["path"])
-        project_name = project["name"]
-        exclude_paths = project["excludes"] + global_exclude_paths
+        project_name = sys.intern(project["name"])
         project_files = []
-        project_folders = []
-
-        for root, _, files in os.walk(base_path):
-            root_path = Path(root)
-            has_md = False
-            for file in files:
-                if file.endswith(".md"):
-                    file_path = root_path / file
-                    if not should_exclude(file_path, exclude_paths):
-                        has_md = True
-                        rel_path = file_path.relative_to(base_path).with_suffix(".html")
-                        project_files.append({
-                            "file_path": file_path,
-                            "rel_path": str(rel_path),
-                            "title": file_path.stem,
-                            "parent": str(file_path.parent.relative_to(base_path)) if file_path.parent != base_path else None,
-                            "project": project_name
-                        })
-            if has_md:
-                current = root_path
-                while current != base_path.parent and current != current.parent:
-                    rel_folder = str(current.relative_to(base_path))
-                    if rel_folder not in project_folders and rel_folder != ".":
-                        project_folders.append(rel_folder)
-                    current = current.parent
+        project_folders = set()
+        scan_cache = None
+        if SCAN_CACHE != 'False':
+            scan_cache_file = get_scan_cache_file(project, global_exclude_paths)
+            scan_cache = None
+            if RESCAN == 'False':
+                scan_cache = SCAN_CACHES.get(scan_cache_file) or load_json_file(scan_cache_file)
+            if not isinstance(scan_cache, dict) or scan_cache.get("version") != SCAN_CACHE_VERSION:
+                scan_cache = {}
+
+        for file in iter_project_markdown_files(project, global_exclude_paths, scan_cache):
+            project_files.append(file)
+            rel_folder = file.parent
+            while rel_folder and rel_folder not in project_folders:
+                project_folders.add(rel_folder)
+                rel_folder = os.path.dirname(rel_folder)  # Ancestors are recorded once.
 
         hierarchy = {}
         project_root_path = f"{project_name}/index.html"
-        hierarchy[project_root_path] = {
-            "title": project_name,
-            "rel_path": project_root_path,
-            "target_path": str(base_path),
-            "sub_pages": [],
-            "is_folder": True,
-            "project": project_name
-        }
+        hierarchy[project_root_path] = Page(project_name, project_root_path, str(base_path), True, project_name)
+
+        if scan_cache is not None:
+            scan_cache["version"] = SCAN_CACHE_VERSION
+            save_json_file(scan_cache_file, scan_cache)
+            SCAN_CACHES[scan_cache_file] = scan_cache
 
         for folder in sorted(project_folders):
-            folder_path = Path(folder) / "index.html"
-            hierarchy[str(folder_path)] = {
-                "title": folder.split('/')[-1],
-                "rel_path": str(folder_path),
-                "target_path": str(base_path / folder),
-                "sub_pages": [],
-                "is_folder": True,
-                "project": project_name
-            }
+            folder_path = os.path.join(folder, "index.html")
+            hierarchy[folder_path] = Page(sys.intern(os.path.basename(folder)), folder_path, str(base_path / folder), True, project_name)
 
         for file in project_files:
-            parent_key = str(Path(file["parent"] or "").joinpath("index.html")) if file["parent"] else project_root_path
-            if file["rel_path"] != parent_key:
-                hierarchy[parent_key]["sub_pages"].append({
-                    "title": file["title"],
-                    "rel_path": file["rel_path"],
-                    "target_path": str(file["file_path"]),
-                    "is_folder": False,
-                    "project": project_name
-                })
+            parent_key = os.path.join(file.parent, "index.html") if file.parent else project_root_path
+            if file.rel_path != parent_key:
+                hierarchy[parent_key].sub_pages.append(file)
 
         for page in hierarchy.values():
-            page["sub_pages"].sort(key=lambda x: x["rel_path"])
+            page.sub_pages.sort(key=lambda x: x.rel_path)
         project_groups[project_name] = list(hierarchy.values())
         markdown_files.extend(project_files)
 
     # Entrée racine globale avec un target_path fictif ou vide mais valide
-    all_pages = [{"title": ROOT_INDEX_TITLE, "rel_path": "index.html", "target_path": str(projects[0]["path"]), "sub_pages": [], "is_folder": True, "project": ROOT_INDEX_PROJECT_NAME, "file_hash": None}]
+    all_pages = [Page(ROOT_INDEX_TITLE, "index.html", str(projects[0]["path"]), True, ROOT_INDEX_PROJECT_NAME)]
     for project_hierarchy in project_groups.values():
-        all_pages.extend(project_hierarchy)
+        for page in project_hierarchy:
+            for sub in page.sub_pages:
+                sub.parent_index = len(all_pages)
+            all_pages.append(page)
     
     return markdown_files, all_pages
 
+# Markdown converter of the current process, reused between files.
+MARKDOWN_CONVERTER = None
+
+def get_markdown_config():
+    """ Extensions and their configs, as set by MARKDOWN_EXTENSIONS and MARKDOWN_EXTENSION_CONFIGS (JSON)."""
+    extensions = [extension for extension in get_config_array(MARKDOWN_EXTENSIONS) if extension]
+    try:
+        extension_configs = json.loads(MARKDOWN_EXTENSION_CONFIGS) if MARKDOWN_EXTENSION_CONFIGS else {}
+    except json.JSONDecodeError:
+        print(" Warning: Invalid MARKDOWN_EXTENSION_CONFIGS, ignoring it.")
+        extension_configs = {}
+    return extensions, extension_configs
+
+def get_markdown_converter():
+    """ Return the Markdown converter of this process, built once per configuration."""
+    global MARKDOWN_CONVERTER
+    extensions, extension_configs = get_markdown_config()
+    config_key = get_fingerprint([extensions, extension_configs, markdown.__version__, FRAGMENT_CACHE_VERSION])
+    if MARKDOWN_CONVERTER is None or MARKDOWN_CONVERTER[0] != config_key:
+        converter = markdown.Markdown(extensions=extensions, extension_configs=extension_configs)
+        MARKDOWN_CONVERTER = (config_key, converter)
+    return MARKDOWN_CONVERTER
+
+def get_fragment_cache_file(content_hash, config_key):
+    key = hashlib.sha256(f"{content_hash}:{config_key}".encode("utf-8")).hexdigest()
+    return CACHE_DIR / "fragments" / key[:2] / f"{key}.html"
+
+# Last converted fragments of this process, when FRAGMENT_MEMORY_CACHE is set (e.g. by the daemon).
+FRAGMENT_MEMORY = OrderedDict()
+
+# Convert Markdown text to an HTML fragment, through the content-addressed caches if enabled.
+def render_markdown(md_content, content_hash=None):
+    config_key, converter = get_markdown_converter()
+    memory_key = None
+    if FRAGMENT_MEMORY_CACHE:
+        content_hash = content_hash or hashlib.sha256(md_content.encode("utf-8")).hexdigest()
+        memory_key = (content_hash, config_key)
+        if memory_key in FRAGMENT_MEMORY:
+            FRAGMENT_MEMORY.move_to_end(memory_key)
+            return FRAGMENT_MEMORY[memory_key]
+    html_content = render_markdown_fragment(md_content, content_hash, config_key, converter)
+    if memory_key is not None:
+        FRAGMENT_MEMORY[memory_key] = html_content
+        while len(FRAGMENT_MEMORY) > FRAGMENT_MEMORY_CACHE:
+            FRAGMENT_MEMORY.popitem(last=False)
+    return html_content
+
+def render_markdown_fragment(md_content, content_hash, config_key, converter):
+    cache_file = None
+    if FRAGMENT_CACHE != 'False':
+        content_hash = content_hash or hashlib.sha256(md_content.encode("utf-8")).hexdigest()
+        cache_file = get_fragment_cache_file(content_hash, config_key)
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            pass
+    html_content = convert_with_timeout(md_content) if CONVERT_TIMEOUT > 0 else converter.reset().convert(md_content)
+    if cache_file is not None:
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                f.write(html_content)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f" Warning: Could not cache fragment '{cache_file}': {e}")
+    return html_content
+
+# Markdown conversions run in a separate process when CONVERT_TIMEOUT is set, so that a pathological file can be killed.
+CONVERT_GUARD = None
+
+def convert_guard_loop(connection, settings):
+    """ Convert the Markdown texts received on a connection until it is closed."""
+    globals().update(settings)
+    converter = get_markdown_converter()[1]
+    connection.send(None)  # Ready: the start of the process does not count in the timeout.
+    while True:
+        try:
+            md_content = connection.recv()
+        except EOFError:
+            return
+        connection.send(converter.reset().convert(md_content))
+
+def get_convert_guard():
+    global CONVERT_GUARD
+    settings = {name: globals()[name] for name in ("MARKDOWN_EXTENSIONS", "MARKDOWN_EXTENSION_CONFIGS")}
+    if CONVERT_GUARD is not None and CONVERT_GUARD[2] == settings and CONVERT_GUARD[0].is_alive():
+        return CONVERT_GUARD
+    stop_convert_guard()
+    # Spawned rather than forked, since the writer threads may hold locks.
+    connection, child_connection = multiprocessing.Pipe()
+    process = multiprocessing.get_context("spawn").Process(target=convert_guard_loop, args=(child_connection, settings), daemon=True)
+    process.start()
+    child_connection.close()
+    CONVERT_GUARD = (process, connection, settings)
+    try:
+        if connection.poll(CONVERT_GUARD_START_TIMEOUT):
+            connection.recv()
+            return CONVERT_GUARD
+    except (EOFError, OSError):
+        pass
+    stop_convert_guard()
+    raise ChildProcessError("the conversion process did not start")
+
+def stop_convert_guard():
+    global CONVERT_GUARD
+    if CONVERT_GUARD is None:
+        return
+    process, connection, _ = CONVERT_GUARD
+    CONVERT_GUARD = None
+    connection.close()
+    process.kill()
+    process.join()
+
+def convert_with_timeout(md_content):
+    """ Convert Markdown in the guard process, killed when it takes longer than CONVERT_TIMEOUT seconds."""
+    process, connection, _ = get_convert_guard()
+    try:
+        connection.send(md_content)
+        if connection.poll(CONVERT_TIMEOUT):
+            return connection.recv()
+    except (EOFError, OSError):
+        stop_convert_guard()
+        raise ChildProcessError("the conversion process failed") from None
+    stop_convert_guard()
+    raise TimeoutError(f"conversion took longer than {CONVERT_TIMEOUT:g}s")
+
 # Save a Markdown file to the output directory
-def save_md_file(md_file, save_dir, base_path):
-    """ Save Markdown files to a folder."""
+def save_md_file(md_file, save_dir, base_path, content=None):
+    """ Save Markdown files to a folder, from the already read content if given."""
     relative_path = md_file.relative_to(base_path)
     save_subdir = save_dir / relative_path.parent
-    save_subdir.mkdir(parents=True, exist_ok=True)
+    make_output_dir(save_subdir)
     save_file = save_subdir / md_file.name
-    shutil.copyfile(md_file, save_file)
-    print(f" Saved: {save_file}")
+    if content is None and OUTPUT_SINK is None:
+        with open(md_file, "rb") as f:
+            write_file_atomic(save_file, iter(lambda: f.read(HASH_CHUNK_SIZE), b""))
+    elif content is None:
+        with open(md_file, "rb") as f:
+            write_output(save_file, f.read())
+    elif is_unchanged_output(save_file, content):
+        return
+    else:
+        write_output(save_file, content)
+    log_file(f" Saved: {save_file}")
+
+# Check if a file already holds the given bytes.
+def is_same_content(file_path, content):
+    try:
+        if os.path.getsize(file_path) != len(content):
+            return False
+        with open(file_path, "rb") as f:
+            return f.read() == content
+    except OSError:
+        return False
+
+# Check if an output on disk already holds the given bytes. Archive builds never look at the disk.
+def is_unchanged_output(file_path, content):
+    return OUTPUT_SINK is None and is_same_content(file_path, content)
 
 # Convert Markdown file to HTML
-def convert_md_to_html(md_file_info, output_dir, all_pages, base_path):
-    """ Convert a Markdown file to HTML and place it in the output tree."""
+def convert_md_to_html(md_file_info, output_dir, all_pages, base_path, source=None, file_hash=None, mtime=None):
+    """ Convert a Markdown file to HTML and place it in the output tree.
+
+    The raw bytes of the file can be passed as source to avoid reading it again,
+    and its mtime (in ns) to date the page in reproducible mode.
+    """
     md_file = md_file_info["file_path"]
-    with open(md_file, "r", encoding="utf-8") as f:
-        md_content = f.read()
+    if source is None:
+        with open(md_file, "r", encoding="utf-8") as f:
+            md_content = f.read()
+        file_size = os.path.getsize(md_file)
+    else:
+        md_content = source.decode("utf-8")
+        file_size = len(source)
     
-    html_content = markdown.markdown(md_content)
+    start = time.perf_counter()
+    html_content = render_markdown(md_content, file_hash)
+    record_page_time("parse", start)
     relative_path = md_file.relative_to(base_path)
     output_subdir = output_dir / relative_path.parent
-    output_subdir.mkdir(parents=True, exist_ok=True)
+    make_output_dir(output_subdir)
     output_file = output_subdir / (md_file.stem + ".html")
     current_page = md_file_info["rel_path"]
     current_dir = os.path.dirname(current_page) or "."
-    adjusted_pages = get_pages_links(current_dir, all_pages, base_path, current_page)  # Ajout de current_page
-    if debug: print(f"convert_md_to_html: current_page={current_page}, , current_dir={current_dir}, adjusted_pages={[p['rel_path'] for p in adjusted_pages]}")
+    start = time.perf_counter()
+    adjusted_pages, breadcrumbs = get_page_nav(current_dir, all_pages, base_path, current_page)  # Ajout de current_page
+    record_page_time("nav", start)
+    if debug: print(f"convert_md_to_html: current_page={current_page}, current_dir={current_dir}, nav entries={len(adjusted_pages)}")
     title = md_file_info["title"]
-    css_path = get_relative_path(CSS_PATH, current_dir)
-    theme_css_path = get_theme_css_path(current_dir)
-    assets_path = get_relative_path(ASSETS_PATH, current_dir)
-    bs_css_path = get_relative_path(BS_CSS_PATH, current_dir)
-    bs_css_path = BS_CSS_URL if USE_EXTERNAL_ASSETS != 'False' else bs_css_path
-    #file_hash = get_file_hash(md_file)
-    file_size = os.path.getsize(md_file)
+    css_path, theme_css_path, assets_path, bs_css_path = get_asset_paths(current_dir)
     
     if debug:
         print(f" Generating page {title}, current_page: {current_page}")
     
-    generate_page(current_page, title, html_content, output_file, adjusted_pages, css_path, theme_css_path, assets_path, bs_css_path, file_size)
+    if is_reproducible() and mtime is None:
+        mtime = os.stat(md_file).st_mtime_ns
+    updated = get_page_updated([mtime]) if is_reproducible() else None
+    generate_page(current_page, title, html_content, output_file, adjusted_pages, css_path, theme_css_path, assets_path, bs_css_path, file_size, file_hash, breadcrumbs=breadcrumbs, updated=updated)
+    if SEARCH != 'False':
+        start = time.perf_counter()
+        search_entry = get_search_entry(current_page, title, html_content)
+        record_page_time("index", start)
+        return search_entry
+    return None
+
+# Stat a source and read it unless its outputs are up to date.
+def read_source(md_file, outputs, previous, nav, full_render):
+    """ Return the stat, the outputs presence and the bytes of a source (None when untouched).
+
+    Untouched files (same size and mtime, outputs present, same navigation) are not read,
+    nor files larger than MAX_FILE_SIZE (False).
+    """
+    stat = os.stat(md_file)
+    outputs_exist = all(os.path.exists(output) for output in outputs)
+    untouched = previous.get("size") == stat.st_size and previous.get("mtime") == stat.st_mtime_ns
+    if untouched and outputs_exist and not full_render and previous.get("nav") == nav:
+        return stat, outputs_exist, None
+    if MAX_FILE_SIZE > 0 and stat.st_size > MAX_FILE_SIZE:
+        return stat, outputs_exist, False  # Too large to be read at once, see write_guarded_page().
+    with open(md_file, "rb") as f:
+        return stat, outputs_exist, f.read()
+
+def get_source_outputs(md_file, output_dir, save_dir, base_path):
+    relative_path = md_file.relative_to(base_path)
+    return [str(save_dir / relative_path), str(output_dir / relative_path.with_suffix(".html"))]
+
+# Build the outputs of a source file, reading it at most once.
+def build_source_file(md_file_info, output_dir, save_dir, all_pages, base_path, previous=None, nav=None, full_render=True, prefetched=None):
+    """ Copy, hash and convert a Markdown file from a single read.
+
+    Returns the manifest state of the source. The result of read_source() can be
+    passed as prefetched when the file was read ahead.
+    """
+    md_file = md_file_info["file_path"]
+    previous = previous or {}
+    outputs = get_source_outputs(md_file, output_dir, save_dir, base_path)
+    start = time.perf_counter()
+    if prefetched is None:
+        prefetched = read_source(md_file, outputs, previous, nav, full_render)
+    stat, outputs_exist, source = prefetched.result() if hasattr(prefetched, "result") else prefetched
+    state = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "outputs": outputs, "nav": nav}
+    if source is None:
+        state["hash"] = previous.get("hash")
+        state["changed"] = state["rendered"] = False
+        if previous.get("guard"):
+            state["guard"] = previous["guard"]
+            state["outputs"] = previous.get("outputs", outputs)
+        return state
+    record_page_time("read", start)
+    
+    if source is False:
+        state["hash"] = get_file_hash(md_file)
+        source = None
+        guard = f"larger than MAX_FILE_SIZE ({stat.st_size} bytes)"
+    else:
+        state["hash"] = hashlib.sha256(source).hexdigest()
+        state["size"] = len(source)
+        guard = None
+    state["changed"] = previous.get("hash") != state["hash"] or not outputs_exist
+    state["rendered"] = full_render or state["changed"] or previous.get("nav") != nav
+    if is_reproducible():
+        state["rendered"] = state["rendered"] or previous.get("mtime") != stat.st_mtime_ns  # The page shows the mtime.
+    if state["changed"]:
+        save_md_file(md_file, save_dir, base_path, source)
+    if state["rendered"] and guard is None:
+        try:
+            state["search"] = convert_md_to_html(md_file_info, output_dir, all_pages, base_path, source, state["hash"], stat.st_mtime_ns)
+        except (TimeoutError, ChildProcessError) as e:
+            guard = str(e)
+    if guard is not None:
+        state["guard"] = guard
+        if state["rendered"]:
+            state["outputs"] += write_guarded_page(md_file_info, output_dir, save_dir, all_pages, base_path, guard, stat)
+        else:
+            state["outputs"] = previous.get("outputs", outputs)
+    return state
+
+# Page of a source that hit a guard (size or conversion timeout), following MAX_FILE_POLICY.
+def write_guarded_page(md_file_info, output_dir, save_dir, all_pages, base_path, guard, stat):
+    """ Write the page of a source that is not converted: a notice (skip), a link to the raw
+    file (copy), or its text streamed into a <pre> block (pre). Return the extra outputs.
+    """
+    md_file = md_file_info["file_path"]
+    relative_path = md_file.relative_to(base_path)
+    output_subdir = output_dir / relative_path.parent
+    make_output_dir(output_subdir)
+    output_file = output_subdir / (md_file.stem + ".html")
+    current_page = md_file_info["rel_path"]
+    current_dir = os.path.dirname(current_page) or "."
+    adjusted_pages, breadcrumbs = get_page_nav(current_dir, all_pages, base_path, current_page)
+    title = md_file_info["title"]
+    css_path, theme_css_path, assets_path, bs_css_path = get_asset_paths(current_dir)
+    print(f" Warning: '{md_file}' not converted: {guard}.")
+    
+    content = f"<p class='guarded'>This file was not converted: {guard} ({format_file_size(stat.st_size)}).</p>"
+    extra_outputs = []
+    content_file = None
+    if MAX_FILE_POLICY == 'copy':
+        raw_file = output_subdir / md_file.name
+        if save_dir != output_dir:
+            save_md_file(md_file, output_dir, base_path)
+            extra_outputs.append(str(raw_file))
+        content += f"<p><a href='{quote(md_file.name)}'>{md_file.name}</a></p>"
+    elif MAX_FILE_POLICY == 'pre':
+        content += f"<pre>{GUARDED_CONTENT}</pre>"
+        content_file = md_file
+    updated = get_page_updated([stat.st_mtime_ns]) if is_reproducible() else None
+    generate_page(current_page, title, content, output_file, adjusted_pages, css_path, theme_css_path, assets_path, bs_css_path,
+                  stat.st_size, breadcrumbs=breadcrumbs, updated=updated, content_file=content_file)
+    return extra_outputs
+
+# Placeholder of the text streamed into a guarded page.
+GUARDED_CONTENT = "\0docmd-guarded-content\0"
+
+def iter_escaped_text(file_path):
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), ""):
+            yield html.escape(chunk, quote=False).encode("utf-8")
 
 # Generate root index page
 def generate_root_index(output_dir, all_pages, base_paths):
     """ Generate a global index.html at the root of the output directory."""
     output_file = output_dir / "index.html"
-    output_file.parent.mkdir(parents=True, exist_ok=True)
+    make_output_dir(output_file.parent)
     current_page = "index.html"  # Page courante pour la racine
     current_dir = "."  # Racine relative
-    adjusted_pages = get_pages_links(current_dir, all_pages, base_paths[0], current_page)  # Utilise le premier base_path comme référence
-    if debug: print(f"generate_root_index: current_page={current_page}, current_dir={current_dir}, adjusted_pages={[p['rel_path'] for p in adjusted_pages]}")
+    adjusted_pages, breadcrumbs = get_page_nav(current_dir, all_pages, base_paths[0], current_page)  # Utilise le premier base_path comme référence
+    if debug: print(f"generate_root_index: current_page={current_page}, current_dir={current_dir}, nav entries={len(adjusted_pages)}")
     
-    ROOT_INDEX_TITLE = os.environ.get("ROOT_INDEX_TITLE", "Documentation Home")
-    ROOT_INDEX_SUB_TITLE = os.environ.get("ROOT_INDEX_SUB_TITLE", "<h2>Welcome to the Documentation</h2>")
-    
-    css_path = get_relative_path(CSS_PATH, current_dir)
-    theme_css_path = get_theme_css_path(current_dir)
-    assets_path = get_relative_path(ASSETS_PATH, current_dir)
-    bs_css_path = get_relative_path(BS_CSS_PATH, current_dir)
-    bs_css_path = BS_CSS_URL if USE_EXTERNAL_ASSETS != 'False' else bs_css_path
+    css_path, theme_css_path, assets_path, bs_css_path = get_asset_paths(current_dir)
     
     # Contenu : liste des projets avec liens vers leurs index
-    content = "<h2>" + ROOT_INDEX_SUB_TITLE + "</h2><ul>"
-    for project in INCLUDE_PATHS:
-        project_name = project["name"]
-        project_index = f"{project_name}/index.html"
-        content += f"<li><a href='{quote(project_index)}'>{project_name}</a></li>"
-    content += "</ul>"
+    content = "<h2>" + ROOT_INDEX_SUB_TITLE + "</h2><ul>" + "".join(
+        f"<li><a href='{quote(project['name'] + '/index.html')}'>{project['name']}</a></li>" for project in INCLUDE_PATHS
+    ) + "</ul>"
     
     if debug: print(f" Generating root index, current_page: {current_page}")
-    generate_page(current_page, ROOT_INDEX_TITLE, content, output_file, adjusted_pages, css_path, theme_css_path, assets_path, bs_css_path)
+    updated = get_page_updated([]) if is_reproducible() else None
+    generate_page(current_page, ROOT_INDEX_TITLE, content, output_file, adjusted_pages, css_path, theme_css_path, assets_path, bs_css_path, breadcrumbs=breadcrumbs, updated=updated)
 
 # Generate folder index page
-def generate_folder_index(folder_path, output_dir, all_pages, sub_pages, base_path):
-    """ Generate an index.html for a folder."""
+def generate_folder_index(folder_path, output_dir, all_pages, sub_pages, base_path, stats=None):
+    """ Generate an index.html for a folder, followed by index-2.html, index-3.html... when its listing is paginated.
+
+    stats are the sizes and mtimes of the sub pages from get_sub_pages_stats(), when already known.
+    """
     #if str(folder_path) == "." and not sub_pages:  # Ignorer la racine globale sans sous-pages
     #    return
     output_file = output_dir / folder_path / "index.html"
-    output_file.parent.mkdir(parents=True, exist_ok=True)
+    make_output_dir(output_file.parent)
     current_page = str(folder_path / "index.html" if folder_path.name else "index.html")
     current_dir = os.path.dirname(current_page) or "."
-    adjusted_pages = get_pages_links(current_dir, all_pages, base_path, current_page)
-    if debug: print(f"generate_folder_index: current_page={current_page}, current_dir={current_dir}, adjusted_pages={[p['rel_path'] for p in adjusted_pages]}")
+    start = time.perf_counter()
+    adjusted_pages, breadcrumbs = get_page_nav(current_dir, all_pages, base_path, current_page)
+    record_page_time("nav", start)
+    if debug: print(f"generate_folder_index: current_page={current_page}, current_dir={current_dir}, nav entries={len(adjusted_pages)}")
     title = folder_path.name if folder_path.name else "Home"
-    css_path = get_relative_path(CSS_PATH, current_dir)
-    theme_css_path = get_theme_css_path(current_dir)
-    assets_path = get_relative_path(ASSETS_PATH, current_dir)
-    bs_css_path = get_relative_path(BS_CSS_PATH, current_dir)
-    bs_css_path = BS_CSS_URL if USE_EXTERNAL_ASSETS != 'False' else bs_css_path
+    css_path, theme_css_path, assets_path, bs_css_path = get_asset_paths(current_dir)
     
-    if debug: print(f" Generating index for {folder_path}, current_page: {current_page}, sub_pages: {sub_pages}")
+    if debug: print(f" Generating index for {folder_path}, current_page: {current_page}, sub_pages: {len(sub_pages)}")
     
+    if stats is None and (FOLDER_INDEX_LAYOUT == 'table' or is_reproducible()):
+        stats = get_sub_pages_stats(sub_pages)
+    updated = get_page_updated([stat[1] for stat in stats if stat]) if is_reproducible() else None
     if not sub_pages:
-        content = f"<h2>{title}</h2>"
-        content += f"<p>You are here: {current_page}</p>"
-    else:
-        content = f"<h2>{title}</h2><ul>"
-        for sub_page in sub_pages:
-            sub_target_path = sub_page["rel_path"]
-            sub_rel_path = get_relative_path(sub_target_path, current_dir)
-            content += f"<li><a href='{quote(sub_rel_path)}'>{sub_page['title']}</a></li>"
-        content += "</ul>"
+        content = f"<h2>{title}</h2><p>You are here: {current_page}</p>"
+        generate_page(current_page, title, content, output_file, adjusted_pages, css_path, theme_css_path, assets_path, bs_css_path, breadcrumbs=breadcrumbs, updated=updated)
+        return
     
-    generate_page(current_page, title, content, output_file, adjusted_pages, css_path, theme_css_path, assets_path, bs_css_path)
+    # Every page of the listing shares the navigation of the folder index.
+    page_size = FOLDER_INDEX_PAGE_SIZE if FOLDER_INDEX_PAGE_SIZE > 0 else len(sub_pages)
+    page_count = get_index_page_count(len(sub_pages))
+    for number in range(1, page_count + 1):
+        first = (number - 1) * page_size
+        listing = get_index_listing(sub_pages[first:first + page_size], current_dir, stats[first:first + page_size] if stats else None)
+        content = f"<h2>{title}</h2>{listing}{get_index_pagination(number, page_count)}"
+        page_file = output_file.parent / get_index_page_name(number)
+        generate_page(current_page, title, content, page_file, adjusted_pages, css_path, theme_css_path, assets_path, bs_css_path, breadcrumbs=breadcrumbs, updated=updated)
 
-def generate_page(current_page, title, content, output_file, pages, css_path, theme_css_path, assets_path, bs_css_path, file_size = None, file_hash = None):
-    
+# Name of a page of a folder index: index.html, then index-2.html, index-3.html...
+def get_index_page_name(number):
+    return "index.html" if number == 1 else f"index-{number}.html"
+
+def get_index_page_count(sub_pages_count):
+    if FOLDER_INDEX_PAGE_SIZE <= 0 or not sub_pages_count:
+        return 1
+    return -(-sub_pages_count // FOLDER_INDEX_PAGE_SIZE)
+
+def get_index_page_files(output_file, sub_pages_count):
+    """ Output files of a folder index, its first page being output_file."""
+    return [str(output_file.parent / get_index_page_name(number)) for number in range(1, get_index_page_count(sub_pages_count) + 1)]
+
+# Size and mtime (in ns) of the sources listed by a folder index, None for a missing one.
+# The manifest states of the build already hold them for its sources, the others are stat-ed.
+def get_sub_pages_stats(sub_pages, sources=None):
+    stats = []
+    for sub_page in sub_pages:
+        state = sources.get(str(sub_page.file_path)) if sources else None
+        if state is not None:
+            stats.append((state["size"], state["mtime"]))
+            continue
+        try:
+            stat = os.stat(sub_page["target_path"])
+            stats.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            stats.append(None)
+    return stats
+
+def format_file_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def get_index_listing(sub_pages, current_dir, stats=None):
+    """ Links of a folder index, as a list or (FOLDER_INDEX_LAYOUT=table) a table with the size and last change of the sources."""
+    links = [f"<a href='{quote(get_relative_path(sub_page['rel_path'], current_dir))}'>{sub_page['title']}</a>" for sub_page in sub_pages]
+    if FOLDER_INDEX_LAYOUT != 'table':
+        return "<ul>" + "".join(f"<li>{link}</li>" for link in links) + "</ul>"
+    rows = []
+    for link, stat in zip(links, stats or [None] * len(links)):
+        updated = get_page_updated([stat[1]]) if stat else None
+        date = datetime.fromtimestamp(updated, timezone.utc).strftime("%Y-%m-%d %H:%M") if updated is not None else ""
+        rows.append(f"<tr><td>{link}</td><td>{format_file_size(stat[0]) if stat else ''}</td><td>{date}</td></tr>")
+    return ("<table class='table table-sm folder-index'><thead><tr><th>Page</th><th>Size</th><th>Last modified (UTC)</th></tr></thead><tbody>"
+            + "".join(rows) + "</tbody></table>")
+
+def get_index_pagination(number, page_count):
+    """ Links to the other pages of a paginated folder index."""
+    if page_count <= 1:
+        return ""
+    def get_item(label, target, state=""):
+        if target is None:
+            return f"<li class='page-item disabled'><span class='page-link'>{label}</span></li>"
+        return f"<li class='page-item{state}'><a class='page-link' href='{get_index_page_name(target)}'>{label}</a></li>"
+    items = [get_item("Previous", number - 1 if number > 1 else None)]
+    items += [get_item(target, target, " active" if target == number else "") for target in range(1, page_count + 1)]
+    items.append(get_item("Next", number + 1 if number < page_count else None))
+    return f"<nav aria-label='Pages'><ul class='pagination'>{''.join(items)}</ul></nav>"
+
+# Pages are dated by their sources in reproducible mode, and in sync mode where the build date would rewrite every page.
+def is_reproducible():
+    return REPRODUCIBLE != 'False' or SYNC_OUTPUT != 'False'
+
+# Last update of a reproducible page: the newest mtime of its sources, clamped to SOURCE_DATE_EPOCH.
+def get_page_updated(mtimes):
+    """ Timestamp (in seconds) of the newest of the given mtimes (in ns), None when there are none."""
+    dates = [mtime // 10**9 for mtime in mtimes]
+    if SOURCE_DATE_EPOCH:
+        dates = [min(date, int(SOURCE_DATE_EPOCH)) for date in dates] or [int(SOURCE_DATE_EPOCH)]
+    return max(dates) if dates else None
+
+def get_page_date(updated):
+    """ Template variables dating a page in reproducible mode, in UTC so that every machine renders the same bytes."""
+    date_human = datetime.fromtimestamp(updated, timezone.utc).strftime("%Y-%m-%d at %H:%M:%S UTC") if updated is not None else ""
+    return {"footer": get_footer(date_human, "Last updated on"), "date_tag_human": date_human}
+
+# Build date and version, written once instead of in every page in reproducible mode.
+def write_build_info(output_dir, pages_count):
+    content = json.dumps({
+        "app": APP_NAME,
+        "version": APP_VERSION,
+        "date": BUILD_DATE.isoformat(timespec="seconds"),
+        "pages": pages_count,
+    }, indent=1).encode("utf-8") + b"\n"
+    write_output(Path(output_dir) / BUILD_INFO_FILE, content)
+    log_file(f" Generated: {Path(output_dir) / BUILD_INFO_FILE}")
+
+# Page template of the current build, resolved once.
+BUILD_TEMPLATE = None
+
+def get_template_globals():
+    """ Template variables shared by every page of a build."""
+    return {
+        "lang": LANG,
+        "theme_mode": THEME_MODE,
+        "footer": FOOTER,
+        "date_tag_human": DATE_TAG_HUMAN,
+        "nav_title": NAV_TITLE,
+        "nav_mode": NAV_MODE,
+        "search": SEARCH != 'False',
+        "asset_url": get_template_asset_url,
+        "app_name": APP_NAME,
+        "app_author": APP_AUTHOR,
+        "app_version": APP_VERSION,
+        "app_description": APP_DESCRIPTION,
+    }
+
+def load_build_template():
+    """ Resolve the page template and install the per-build template globals."""
+    global BUILD_TEMPLATE
+    BUILD_TEMPLATE = None
+    JINJA_ENV.globals.update(get_template_globals())
     try:
         template = JINJA_ENV.get_template(TEMPLATE)
     except jinja2.TemplateNotFound:
         print(f" Error: Template '{TEMPLATE}' not found in 'templates/'")
+        return None
+    BUILD_TEMPLATE = (JINJA_ENV, TEMPLATE, template)
+    return template
+
+def get_build_template():
+    if BUILD_TEMPLATE is None or BUILD_TEMPLATE[0] is not JINJA_ENV or BUILD_TEMPLATE[1] != TEMPLATE:
+        return load_build_template()
+    return BUILD_TEMPLATE[2]
+
+# Asset paths relative to a page folder, memoized per folder.
+def get_asset_paths(current_dir):
+    return get_dir_asset_paths(current_dir, get_theme(get_current_theme()), USE_EXTERNAL_ASSETS, tuple(ASSET_MANIFEST.items()))
+
+@lru_cache(maxsize=4096)
+def get_dir_asset_paths(current_dir, theme, use_external_assets, asset_names=()):
+    css_path = get_relative_path(get_asset_url(CSS_PATH), current_dir)
+    theme_css_path = get_theme_css_path(current_dir)
+    assets_path = get_relative_path(ASSETS_PATH, current_dir)
+    bs_css_path = get_relative_path(get_asset_url(BS_CSS_PATH), current_dir)
+    bs_css_path = BS_CSS_URL if use_external_assets != 'False' else bs_css_path
+    return css_path, theme_css_path, assets_path, bs_css_path
+
+def generate_page(current_page, title, content, output_file, pages, css_path, theme_css_path, assets_path, bs_css_path, file_size = None, file_hash = None, breadcrumbs = None, updated = None, content_file = None):
+    
+    template = get_build_template()
+    if template is None:
         return
     title = title if title else "Home"
     page_id = format_alias(current_page, "_")
     body_class = get_body_class(current_page)
+    root_path = get_relative_prefix(".", os.path.dirname(current_page) or ".")
     
+    start = time.perf_counter()
     html_output = template.render(
         title=title,
         content=content,
-        lang=LANG,
         pages=pages,
         current_page=current_page,
         page_id=page_id,
         body_class=body_class,
         css_path=css_path,
         theme_css_path=theme_css_path,
-        theme_mode=THEME_MODE,
         assets_path=assets_path,
-        footer=FOOTER,
-        date_tag_human=DATE_TAG_HUMAN,
         file_size=file_size,
         file_hash=file_hash,
         bs_css_path=bs_css_path,
-        nav_title=NAV_TITLE,
-        app_name=APP_NAME,
-        app_author=APP_AUTHOR,
-        app_version=APP_VERSION,
-        app_description=APP_DESCRIPTION
-    )
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(html_output)
-    print(f" Generated: {output_file}")
-
-def is_in_hierarchy(page, current_page_full):
-    """Check if current_page_full is in the hierarchy of page."""
-    return any(
-        sub.get("rel_path", "") == current_page_full or is_in_hierarchy(sub, current_page_full)
-        for sub in page.get("sub_pages", [])
+        root_path=root_path,
+        breadcrumbs=breadcrumbs or [],
+        **(get_page_date(updated) if is_reproducible() else {})
     )
+    record_page_time("render", start)
+    start = time.perf_counter()
+    if content_file is None:
+        html_bytes = html_output.encode("utf-8")
+        write_output(output_file, html_bytes)
+        output_bytes = len(html_bytes)
+    else:
+        # The text of a large file is streamed into the page instead of being held in memory.
+        head, tail = html_output.split(GUARDED_CONTENT, 1)
+        output_bytes = write_output_stream(output_file, chain([head.encode("utf-8")], iter_escaped_text(content_file), [tail.encode("utf-8")]))
+    record_page_time("write", start)
+    if PAGE_STATS is not None:
+        PAGE_STATS["output_bytes"] = PAGE_STATS.get("output_bytes", 0) + output_bytes
+    log_file(f" Generated: {output_file}")
+
+# Navigation index, built once per pages hierarchy.
+NAV_INDEX = None
+
+def build_nav_index(all_pages):
+    """ Positions of the top pages and parent folders of the sub-pages, by path."""
+    tops = {}
+    parents = {}
+    for page_index, page in enumerate(all_pages):
+        tops.setdefault(page.rel_path, []).append(page_index)
+        for sub in page.sub_pages:
+            parents.setdefault(sub.rel_path, []).append(sub.parent_index)
+    return {
+        "all_pages": all_pages,
+        "tops": tops,
+        "parents": parents,
+    }
+
+def get_nav_index(all_pages):
+    global NAV_INDEX
+    if NAV_INDEX is None or NAV_INDEX["all_pages"] is not all_pages:
+        NAV_INDEX = build_nav_index(all_pages)
+    return NAV_INDEX
+
+# Link to a page as seen from the page being rendered.
+class PageLink:
+    """ Lightweight view of a Page for the templates: a relative link and an active state.
+
+    Links are made while the navigation is rendered and nothing is copied from the
+    page, so the sidebar of a page costs no more than its output.
+    """
+    __slots__ = ("page", "current_dir", "current_page", "is_active")
+
+    def __init__(self, page, current_dir, current_page, is_active):
+        self.page = page
+        self.current_dir = current_dir
+        self.current_page = current_page
+        self.is_active = is_active
+
+    title = property(lambda self: self.page.title)
+    project = property(lambda self: self.page.project)
+    is_folder = property(lambda self: self.page.is_folder)
+    target_path = property(lambda self: self.page.target_path)
+    ref_path = property(lambda self: self.page.rel_path)
+
+    @property
+    def rel_path(self):
+        return get_relative_path(self.page.rel_path, self.current_dir)
+
+    @property
+    def is_current(self):
+        return self.page.rel_path == self.current_page
+
+    @property
+    def sub_pages(self):
+        return [PageLink(sub, self.current_dir, self.current_page, sub.rel_path == self.current_page)
+                for sub in self.page.sub_pages]
+
+    __getitem__ = Page.__getitem__
+    get = Page.get
 
 def get_pages_links(current_dir, all_pages, base_path, current_page):
     if debug: print(f"get_pages_links: current_dir={current_dir}, current_page={current_page}")
-    pages = []
     current_page_full = str(current_page)
+    nav_index = get_nav_index(all_pages)
+
+    # Page is active if it’s current or a direct ancestor
+    # is_active is set to True for the current page and its direct ancestors in the hierarchy.
+    # Other pages (e.g., unrelated project roots) remain inactive.
+    active = set(nav_index["tops"].get(current_page_full, []) + nav_index["parents"].get(current_page_full, []))
+    return [PageLink(page, current_dir, current_page_full, page_index in active) for page_index, page in enumerate(all_pages)]
 
-    for page in all_pages:
-        page = page.copy()
-        page["ref_path"] = page.get("rel_path", "")
-        page["rel_path"] = get_relative_path(page["ref_path"], current_dir)
-        page["is_current"] = page["ref_path"] == current_page_full
-        # Page is active if it’s current or a direct ancestor
-        # is_active is set to True for the current page and its direct ancestors in the hierarchy.
-        # Other pages (e.g., unrelated project roots) remain inactive.
-        page["is_active"] = page["is_current"]
-        if debug: print(f"page: ref_path={page['ref_path']}, is_current={page['is_current']}, is_active={page['is_active']}, sub_pages={[sub['rel_path'] for sub in page['sub_pages']]}")
-
-        # Process sub-pages
-        page["sub_pages"] = [
-            {**sub,
-             "ref_path": sub.get("rel_path", ""),
-             "rel_path": get_relative_path(sub.get("rel_path", ""), current_dir),
-             "is_current": sub.get("rel_path", "") == current_page_full,
-             "is_active": sub.get("rel_path", "") == current_page_full
-            }
-            for sub in page.get("sub_pages", [])
-        ]
-        # Propagate is_active up the hierarchy if a sub-page is current or active
-        if any(sub["is_current"] or sub["is_active"] for sub in page["sub_pages"]):
-            page["is_active"] = True
-
-        for sub in page["sub_pages"]:
-            if debug: print(f"sub_page: ref_path={sub['ref_path']}, is_current={sub['is_current']}, is_active={sub['is_active']}")
-
-        pages.append(page)
-
-    # Propagate is_active to ancestors in the hierarchy
-    for page in pages:
-        if is_in_hierarchy(page, current_page_full):
-            page["is_active"] = True
-
-    return pages
+# Navigation of a page: the full sidebar when embedded, only breadcrumbs when built client-side.
+def get_page_nav(current_dir, all_pages, base_path, current_page):
+    if NAV_MODE == 'client':
+        return [], get_breadcrumbs(all_pages, current_page, current_dir)
+    return get_pages_links(current_dir, all_pages, base_path, current_page), []
+
+def get_breadcrumb_paths(nav_index, current_page):
+    """ Root-relative paths of the index pages leading to a page."""
+    tops = nav_index["tops"]
+    candidates = ["index.html"]
+    for page_index in tops.get(current_page, []) + nav_index["parents"].get(current_page, []):
+        candidates.append(f"{nav_index['all_pages'][page_index]['project']}/index.html")
+        break
+    parts = current_page.split("/")[:-1]
+    candidates += ["/".join(parts[:depth]) + "/index.html" for depth in range(1, len(parts) + 1)]
+    paths = []
+    for candidate in candidates:
+        if candidate != current_page and candidate in tops and candidate not in paths:
+            paths.append(candidate)
+    return paths
+
+def get_breadcrumbs(all_pages, current_page, current_dir):
+    nav_index = get_nav_index(all_pages)
+    return [
+        {"title": nav_index["all_pages"][nav_index["tops"][path][0]]["title"],
+         "ref_path": path,
+         "rel_path": get_relative_path(path, current_dir)}
+        for path in get_breadcrumb_paths(nav_index, current_page)
+    ]
+
+def get_nav_data(all_pages):
+    """ Compact navigation tree for the client-side sidebar, grouped by project like the template."""
+    projects = OrderedDict()
+    for page in sorted(all_pages, key=lambda p: p.project):
+        projects.setdefault(page.project, []).append([
+            page.rel_path, page.title, int(page.is_folder),
+            [[sub.rel_path, sub.title, int(sub.is_folder)] for sub in page.sub_pages]
+        ])
+    return {"title": NAV_TITLE, "projects": [[name, pages] for name, pages in projects.items()]}
+
+def get_nav_script(all_pages):
+    """ Navigation tree as a script usable from file:// as well."""
+    data = json.dumps(get_nav_data(all_pages), ensure_ascii=False, separators=(",", ":"))
+    return f"window.DOCMD_NAV={data};\n".encode("utf-8")
+
+def write_nav_script(output_dir, all_pages):
+    """ Write the navigation tree once, for all the pages."""
+    nav_file = Path(output_dir) / NAV_SCRIPT_PATH
+    make_output_dir(nav_file.parent)
+    content = get_nav_script(all_pages)
+    if is_unchanged_output(nav_file, content):
+        return
+    write_output(nav_file, content)
+    log_file(f" Generated: {nav_file}")
 
 # Get relative path from current directory.
 def get_relative_path(target_path, current_dir):
-    rel_path = os.path.relpath(target_path, current_dir).replace("\\", "/")
+    target_dir, target_name = os.path.split(target_path)
+    if not target_name:
+        rel_path = os.path.relpath(target_path, current_dir).replace("\\", "/")
+        return rel_path or target_path
+    prefix = get_relative_prefix(target_dir or ".", current_dir)
+    rel_path = target_name if prefix == "." else f"{prefix}/{target_name}"
     return rel_path or target_path
 
+# Relative path between two directories, memoized since pages share few directories.
+@lru_cache(maxsize=65536)
+def get_relative_prefix(target_dir, current_dir):
+    return os.path.relpath(target_dir, current_dir).replace("\\", "/")
+
 def get_body_class(current_page):
     current_page = current_page if current_page != "" else 'Default'
     body_class = format_alias(APP_NAME)
@@ -413,11 +1186,11 @@ def get_body_class(current_page):
 
 def get_file_hash(file_name):
     if os.path.exists(file_name):
+      m = hashlib.sha256()
       with open(file_name, 'rb') as file_obj:
-          file_contents = file_obj.read()
-          #m = hashlib.sha256()
-          #m.update(file_contents.encode('utf-8'))
-          #return m.hexdigest()
+          for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b''):
+              m.update(chunk)
+      return m.hexdigest()
     else:
       return None
 
@@ -444,9 +1217,24 @@ def get_theme_css_path(current_dir):
     current_theme = get_current_theme()
     theme = get_theme(current_theme)
     THEME_CSS_PATH = f"static/css/style-{theme}.css"
-    theme_css_path = get_relative_path(THEME_CSS_PATH, current_dir)
+    theme_css_path = get_relative_path(get_asset_url(THEME_CSS_PATH), current_dir)
     return theme_css_path
 
+# Path of a static asset, under its fingerprinted name when it has one.
+def get_asset_url(path):
+    name = path[len(ASSETS_PATH) + 1:] if path.startswith(ASSETS_PATH + "/") else path
+    return f"{ASSETS_PATH}/{ASSET_MANIFEST[name]}" if name in ASSET_MANIFEST else path
+
+@jinja2.pass_context
+def get_template_asset_url(context, path):
+    """ Template helper: link to a static asset (relative to static/) from the rendered page.
+
+    Fingerprinted assets are linked by name, generated ones carry their content hash and the others the app version.
+    """
+    if path in ASSET_MANIFEST:
+        return f"{context['assets_path']}/{ASSET_MANIFEST[path]}"
+    return f"{context['assets_path']}/{path}?v={ASSET_VERSIONS.get(path, APP_VERSION)}"
+
 # Security check for directories
 def directory_security_check(directory):
     """ Check if a directory is safe to use."""
@@ -465,74 +1253,1959 @@ def clean_dir(directory):
     if not directory_security_check(directory):
         print(f" Error: Attempt to clean invalid directory '{directory}' skipped.")
         return False
-    backup_dir = BACKUP_DIR / f"{directory.name}_{DATE_TAG}"
     if directory.exists():
-        print(f" Backing up '{directory}' to '{backup_dir}'.")
-        BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+        print(f" Backing up '{directory}' to '{BACKUP_DIR}'.")
         try:
-            shutil.move(directory, backup_dir)
+            snapshot_id = snapshot_dir(directory)
         except Exception as e:
-            print(f" Error: Failed to backup '{directory}' to '{backup_dir}': {e}")
+            print(f" Error: Failed to backup '{directory}' to '{BACKUP_DIR}': {e}")
             return False
+        print(f" Snapshot: {snapshot_id}")
+        shutil.rmtree(directory)
+        prune_snapshots()
     directory.mkdir(parents=True, exist_ok=True)
     return True
 
+# Backup store: files are kept once by content hash, each snapshot is a JSON list of its files.
+def get_backup_object(file_hash):
+    return BACKUP_DIR / "objects" / file_hash[:2] / file_hash
+
+def get_snapshots(name=None):
+    """ List the snapshots of the backup store, oldest first."""
+    snapshots = []
+    for snapshot_file in (BACKUP_DIR / "snapshots").glob("*.json"):
+        snapshot = load_json_file(snapshot_file)
+        if isinstance(snapshot, dict) and (name is None or snapshot.get("name") == name):
+            snapshots.append(dict(snapshot, id=snapshot_file.stem))
+    return sorted(snapshots, key=lambda snapshot: (snapshot["created"], snapshot["id"]))
+
+def snapshot_dir(directory):
+    """ Store a snapshot of a directory and return its id.
+
+    Files already in the store are not copied again, and files whose size and mtime
+    match the previous snapshot are not hashed again.
+    """
+    directory = Path(directory)
+    previous = get_snapshots(directory.name)
+    previous_files = previous[-1]["files"] if previous else {}
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = Path(root) / name
+            stat = path.stat()
+            relative_path = path.relative_to(directory).as_posix()
+            known = previous_files.get(relative_path)
+            if known and known[1:] == [stat.st_size, stat.st_mtime_ns] and get_backup_object(known[0]).exists():
+                file_hash = known[0]
+            else:
+                file_hash = get_file_hash(path)
+            backup_object = get_backup_object(file_hash)
+            if not backup_object.exists():
+                backup_object.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    # The directory is removed right after, so the file can be shared, unless it is
+                    # linked elsewhere too (e.g. a static asset) where it could change under its hash.
+                    if stat.st_nlink > 1:
+                        raise OSError("shared file")
+                    os.link(path, backup_object)
+                except OSError:
+                    tmp_file = backup_object.with_name(f"{backup_object.name}.{os.getpid()}.tmp")
+                    shutil.copy2(path, tmp_file)
+                    os.replace(tmp_file, backup_object)
+            files[relative_path] = [file_hash, stat.st_size, stat.st_mtime_ns]
+    snapshot_id = f"{directory.name}_{DATE_TAG}"
+    count = 1
+    while (BACKUP_DIR / "snapshots" / f"{snapshot_id}.json").exists():
+        count += 1
+        snapshot_id = f"{directory.name}_{DATE_TAG}-{count}"
+    save_json_file(BACKUP_DIR / "snapshots" / f"{snapshot_id}.json", {
+        "name": directory.name,
+        "source": str(directory),
+        "created": time.time(),
+        "files": files,
+    })
+    return snapshot_id
+
+def prune_snapshots(keep=None, max_age_days=None):
+    """ Apply the retention policy to the snapshots and delete the unused files of the store.
+
+    Per directory name, only the last `keep` snapshots younger than `max_age_days` are kept (0 disables
+    a limit), and the latest snapshot is always kept.
+    """
+    keep = int(BACKUP_KEEP if keep is None else keep)
+    max_age_days = float(BACKUP_MAX_AGE_DAYS if max_age_days is None else max_age_days)
+    snapshots = get_snapshots()
+    names = {snapshot["name"] for snapshot in snapshots}
+    removed = []
+    for name in names:
+        named = [snapshot for snapshot in snapshots if snapshot["name"] == name][:-1]
+        if keep > 0:
+            removed.extend(named[:max(len(named) + 1 - keep, 0)])
+        if max_age_days > 0:
+            removed.extend(snapshot for snapshot in named if time.time() - snapshot["created"] > max_age_days * 86400)
+    removed_ids = {snapshot["id"] for snapshot in removed}
+    for snapshot_id in removed_ids:
+        (BACKUP_DIR / "snapshots" / f"{snapshot_id}.json").unlink()
+    if removed_ids:
+        used = {file[0] for snapshot in snapshots if snapshot["id"] not in removed_ids for file in snapshot["files"].values()}
+        for backup_object in (BACKUP_DIR / "objects").glob("*/*"):
+            if backup_object.name not in used:
+                backup_object.unlink()
+    return sorted(removed_ids)
+
+def restore_snapshot(snapshot_id, target_dir=None):
+    """ Restore a snapshot to its source directory, or to target_dir. The current content is backed up first."""
+    snapshot = load_json_file(BACKUP_DIR / "snapshots" / f"{snapshot_id}.json")
+    if not isinstance(snapshot, dict):
+        print(f" Error: Snapshot '{snapshot_id}' not found in '{BACKUP_DIR}'.")
+        return False
+    target_dir = Path(target_dir or snapshot["source"])
+    if not clean_dir(target_dir):
+        return False
+    for relative_path, (file_hash, _, mtime_ns) in snapshot["files"].items():
+        target_file = target_dir / relative_path
+        target_file.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(get_backup_object(file_hash), target_file)
+        os.utime(target_file, ns=(mtime_ns, mtime_ns))
+    print(f" Restored '{snapshot_id}' to '{target_dir}' ({len(snapshot['files'])} files).")
+    return True
+
+# Full-text search: plain text and headings of each page, gathered in an inverted index split by term prefix.
+class SearchTextParser(HTMLParser):
+    """ Collect the text and the headings of an HTML fragment."""
+
+    HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.text = []
+        self.headings = []
+        self.heading = None
+        self.skipped = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.HEADINGS:
+            self.heading = []
+        elif tag in ("script", "style"):
+            self.skipped += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.HEADINGS and self.heading is not None:
+            self.headings.append("".join(self.heading).strip())
+            self.heading = None
+        elif tag in ("script", "style"):
+            self.skipped = max(0, self.skipped - 1)
+
+    def handle_data(self, data):
+        if self.skipped:
+            return
+        self.text.append(data)
+        if self.heading is not None:
+            self.heading.append(data)
+
+def get_search_terms(text):
+    """ Index terms of a text: lowercase words of 2 characters or more, without accents.
+
+    Letters of any script are kept, and the query is split the same way by script.js.
+    """
+    text = SEARCH_ACCENTS.sub("", unicodedata.normalize("NFKD", text.lower()))
+    return [term for term in get_search_word_pattern().findall(text) if 2 <= len(term) <= 40]
+
+@lru_cache(maxsize=None)
+def get_search_word_pattern():
+    """ Words of the index: letters and digits with their combining marks, like [\\p{L}\\p{M}\\p{N}] in script.js."""
+    # Combining marks are only assigned in the first two planes and among the variation selectors.
+    marks = "".join(chr(code) for code in chain(range(0x20000), range(0xE0000, 0xE1000))
+                    if unicodedata.category(chr(code)).startswith("M"))
+    return re.compile(f"(?:[^\\W_]|[{re.escape(marks)}])+")
+
+def get_search_entry(current_page, title, html_content):
+    """ Weighted terms of a page, from its converted content."""
+    parser = SearchTextParser()
+    parser.feed(html_content)
+    parser.close()
+    weights = {}
+    for kind, texts in (("text", parser.text), ("heading", parser.headings), ("title", [title])):
+        for text in texts:
+            for term in get_search_terms(text):
+                weights[term] = weights.get(term, 0) + SEARCH_WEIGHTS[kind]
+    return {"url": current_page, "title": title, "terms": weights}
+
+def load_search_cache(output_dir):
+    """ Search entries of the previous build, by source."""
+    search_cache = load_json_file(Path(output_dir) / SEARCH_CACHE_FILE)
+    if not isinstance(search_cache, dict) or search_cache.get("version") != SEARCH_CACHE_VERSION:
+        return {}
+    return search_cache["entries"]
+
+def save_search_cache(output_dir, entries):
+    save_json_file(Path(output_dir) / SEARCH_CACHE_FILE, {"version": SEARCH_CACHE_VERSION, "entries": entries})
+
+def get_search_docs(md_files):
+    """ Pages of the search index by id, as (source, url, title), known as soon as the sources are scanned."""
+    return sorted(((str(page["file_path"]), page["rel_path"], page["title"]) for page in md_files),
+                  key=lambda doc: (doc[1], doc[0]))
+
+def get_search_docs_script(docs):
+    data = json.dumps([[url, title] for _, url, title in docs], ensure_ascii=False, separators=(",", ":"))
+    return f"window.DOCMD_SEARCH_DOCS={data};\n"
+
+def write_search_index(output_dir, entries, md_files):
+    """ Write the documents list and the index shards as scripts (usable from file://), and return their stats.
+
+    docs.js also lists the content hash of each shard, that the shard is loaded with.
+    Unchanged shards are not written again, and shards without terms are deleted.
+    """
+    search_dir = Path(output_dir) / SEARCH_PATH
+    make_output_dir(search_dir)
+    docs = get_search_docs(md_files)
+    shards = {}
+    for doc_id, (path, _, _) in enumerate(docs):
+        # Pages kept out of the index by a guard are listed without terms.
+        for term, weight in entries.get(path, {}).get("terms", {}).items():
+            shards.setdefault(term[:SEARCH_PREFIX_LENGTH], {}).setdefault(term, []).extend((doc_id, weight))
+    files = {}
+    for prefix, terms in shards.items():
+        files[f"{prefix}.js"] = f"DOCMD_SEARCH_SHARD({json.dumps(prefix)},{json.dumps(terms, sort_keys=True, separators=(',', ':'))});\n"
+    versions = {name[:-3]: hashlib.sha256(content.encode("utf-8")).hexdigest()[:10] for name, content in files.items()}
+    files["docs.js"] = (get_search_docs_script(docs)
+                        + f"window.DOCMD_SEARCH_SHARDS={json.dumps(versions, sort_keys=True, separators=(',', ':'))};\n")
+    stats = {"documents": len(docs), "terms": sum(len(terms) for terms in shards.values()), "shards": len(shards), "bytes": 0, "written": 0}
+    for name, content in files.items():
+        data = content.encode("utf-8")
+        stats["bytes"] += len(data)
+        if not is_unchanged_output(search_dir / name, data):
+            write_output(search_dir / name, data)
+            stats["written"] += 1
+    if OUTPUT_SINK is None:
+        for stale in search_dir.glob("*.js"):
+            if stale.name not in files:
+                stale.unlink()
+    return stats
+
+# Manifest helpers for incremental builds
+def load_json_file(json_file):
+    """ Load a JSON file, or None if missing or invalid."""
+    try:
+        with open(json_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_json_file(json_file, data):
+    """ Save a JSON file atomically."""
+    json_file = Path(json_file)
+    json_file.parent.mkdir(parents=True, exist_ok=True)
+    write_file_atomic(json_file, json.dumps(data, indent=1, sort_keys=True).encode("utf-8"))
+
+def load_manifest(output_dir, save_dir=None):
+    """ Load the build manifest of a previous run, or None if missing or outdated.
+
+    Output paths are stored relative to the output (and save) folders, and resolved here.
+    """
+    manifest = load_json_file(Path(output_dir) / MANIFEST_FILE)
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    # The outputs are kept, but not the temporary files of a build that was interrupted while writing them.
+    for directory in {Path(output_dir), Path(save_dir or output_dir)}:
+        remove_tmp_files(directory)
+    return resolve_manifest_paths(manifest, output_dir, save_dir or output_dir)
+
+def remove_tmp_files(directory):
+    """ Delete the temporary files left by write_file_atomic in a folder and its subfolders."""
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if TMP_FILE_PATTERN.match(name):
+                with suppress(OSError):
+                    os.unlink(os.path.join(root, name))
+
+def resolve_manifest_paths(manifest, output_dir, save_dir):
+    for state in manifest.get("sources", {}).values():
+        save_file, output_file = state["outputs"]
+        state["outputs"] = [os.path.normpath(os.path.join(save_dir, save_file)), os.path.normpath(os.path.join(output_dir, output_file))]
+    manifest["indexes"] = {os.path.normpath(os.path.join(output_dir, index)): nav for index, nav in manifest.get("indexes", {}).items()}
+    return manifest
+
+def keeps_build_state(shard=None):
+    """ Whether the manifest and the search cache are left in the output folder.
+
+    Only incremental builds and the merge of shards read them again, other sites are published without them,
+    since they hold the source paths.
+    """
+    return INCREMENTAL != 'False' or shard is not None
+
+def save_manifest(output_dir, manifest, save_dir=None):
+    """ Save the build manifest in the output directory."""
+    save_dir = save_dir or output_dir
+    sources = {}
+    for key, state in manifest.get("sources", {}).items():
+        save_file, output_file = state["outputs"]
+        sources[key] = dict(state, outputs=[os.path.relpath(save_file, save_dir), os.path.relpath(output_file, output_dir)])
+    indexes = {os.path.relpath(index, output_dir): nav for index, nav in manifest.get("indexes", {}).items()}
+    save_json_file(Path(output_dir) / MANIFEST_FILE, dict(manifest, sources=sources, indexes=indexes))
+
+def get_fingerprint(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def get_build_fingerprint():
+    """ Fingerprint of everything besides the sources that ends up in the pages."""
+    try:
+        template_source = JINJA_ENV.loader.get_source(JINJA_ENV, TEMPLATE)[0]
+    except jinja2.TemplateNotFound:
+        template_source = None
+    return get_fingerprint({
+        "template": TEMPLATE,
+        "template_hash": hashlib.sha256(template_source.encode("utf-8")).hexdigest() if template_source is not None else None,
+        "theme": get_theme(get_current_theme()),
+        "config": [LANG, NAV_TITLE, USE_EXTERNAL_ASSETS, ROOT_INDEX_TITLE, ROOT_INDEX_SUB_TITLE,
+                   ROOT_INDEX_PROJECT_NAME, ROOT_DISPLAY_MENU, ROOT_SPLASH_PAGE, APP_VERSION, NAV_MODE, SEARCH],
+        "reproducible": [SOURCE_DATE_EPOCH] if is_reproducible() else None,
+        "folder_index": [FOLDER_INDEX_PAGE_SIZE, FOLDER_INDEX_LAYOUT],
+        "guards": [MAX_FILE_SIZE, MAX_FILE_POLICY, CONVERT_TIMEOUT],
+        "markdown": [get_markdown_config(), markdown.__version__],
+        "projects": [[str(p["path"]), p["name"]] for p in INCLUDE_PATHS],
+        "precompress": [get_precompress_formats(PRECOMPRESS)[0], PRECOMPRESS_MIN_SIZE] if PRECOMPRESS != 'False' else None,
+        "assets": ASSET_MANIFEST or None,
+    })
+
+def get_nav_fingerprint(all_pages):
+    """ Fingerprint of the pages hierarchy, shared by the navigation of every page."""
+    return get_fingerprint([
+        [page.rel_path, page.title, page.project, page.is_folder,
+         [[sub.rel_path, sub.title, sub.is_folder] for sub in page.sub_pages]]
+        for page in all_pages
+    ])
+
+def get_page_nav_fingerprint(all_pages, current_page, nav_fingerprint, sub_pages=None):
+    """ Fingerprint of the navigation embedded in a page (plus the listing of a folder index)."""
+    if NAV_MODE != 'client':
+        return nav_fingerprint
+    nav_index = get_nav_index(all_pages)
+    breadcrumbs = [[path, nav_index["all_pages"][nav_index["tops"][path][0]]["title"]]
+                   for path in get_breadcrumb_paths(nav_index, current_page)]
+    listing = [[sub["rel_path"], sub["title"]] for sub in sub_pages or []]
+    # The navigation itself is only linked, under the version of nav.js.
+    return get_fingerprint([breadcrumbs, listing, ASSET_VERSIONS])
+
+def get_folder_index_fingerprint(all_pages, page, nav_fingerprint, stats=None):
+    """ Fingerprint of the pages of a folder index: their navigation, plus the sizes and dates they show (stats)."""
+    fingerprint = get_page_nav_fingerprint(all_pages, page["rel_path"], nav_fingerprint, page["sub_pages"])
+    if stats is not None:
+        fingerprint = get_fingerprint([fingerprint, stats])
+    return fingerprint
+
+def remove_stale_outputs(previous_outputs, current_outputs):
+    """ Delete the outputs of a previous build that the current one no longer produces."""
+    for stale in sorted(set(previous_outputs) - set(current_outputs)):
+        stale_path = Path(stale)
+        if stale_path.is_file():
+            stale_path.unlink()
+            log_file(f" Removed: {stale_path}")
+        for name in PRECOMPRESS_LEVELS:
+            with suppress(FileNotFoundError):
+                os.unlink(f"{stale}.{name}")
+
+# Number of worker processes for rendering ("auto" or 0 uses every CPU core).
+def get_jobs(jobs):
+    jobs = str(jobs).strip().lower() if jobs is not None else ""
+    if jobs in ("auto", "0"):
+        return os.cpu_count() or 1
+    try:
+        return max(1, int(jobs))
+    except ValueError:
+        return 1
+
+# Settings shipped to the worker processes, so that spawned workers match the parent.
+WORKER_SETTINGS = (
+    "LANG", "debug", "INCLUDE_PATHS", "EXCLUDE_PATHS", "SAVE_DIR", "OUTPUT_DIR", "TEMPLATE",
+    "DATE_TAG", "DATE_TAG_HUMAN", "ROOT_INDEX_TITLE", "ROOT_INDEX_SUB_TITLE", "ROOT_INDEX_PROJECT_NAME",
+    "ROOT_DISPLAY_MENU", "ROOT_SPLASH_PAGE", "NAV_TITLE", "THEME", "THEME_MODE", "FOOTER", "USE_EXTERNAL_ASSETS",
+    "NAV_MODE", "CACHE_DIR", "MARKDOWN_EXTENSIONS", "MARKDOWN_EXTENSION_CONFIGS", "FRAGMENT_CACHE",
+    "BYTECODE_CACHE", "QUIET", "WRITERS", "WRITE_QUEUE_DEPTH", "PREFETCH_DEPTH", "FRAGMENT_MEMORY_CACHE", "SEARCH",
+    "PRECOMPRESS", "PRECOMPRESS_MIN_SIZE", "ASSET_MANIFEST", "ASSET_VERSIONS", "REPRODUCIBLE", "SYNC_OUTPUT", "SOURCE_DATE_EPOCH",
+    "FOLDER_INDEX_PAGE_SIZE", "FOLDER_INDEX_LAYOUT",
+    "MAX_FILE_SIZE", "MAX_FILE_POLICY", "CONVERT_TIMEOUT",
+)
+
+# Pages hierarchy of the current build, set once per worker process.
+WORKER_PAGES = None
+
+def get_worker_settings():
+    settings = {name: globals()[name] for name in WORKER_SETTINGS}
+    loader = JINJA_ENV.loader
+    settings["template_dirs"] = list(loader.searchpath) if isinstance(loader, jinja2.FileSystemLoader) else None
+    return settings
+
+def init_worker(pages_hierarchy, settings):
+    """ Initialize a render worker with the build settings and the pages hierarchy."""
+    global WORKER_PAGES, JINJA_ENV
+    settings = dict(settings)
+    template_dirs = settings.pop("template_dirs", None)
+    globals().update(settings)
+    if template_dirs is not None and not (isinstance(JINJA_ENV.loader, jinja2.FileSystemLoader)
+                                          and list(JINJA_ENV.loader.searchpath) == template_dirs):
+        JINJA_ENV = create_jinja_env(template_dirs)
+    WORKER_PAGES = pages_hierarchy
+
+def build_source_file_task(md_file_info, output_dir, save_dir, base_path, previous, nav, full_render, prefetched=None):
+    start_page_stats(md_file_info["rel_path"])
+    state = build_source_file(md_file_info, output_dir, save_dir, WORKER_PAGES, base_path, previous, nav, full_render, prefetched)
+    state["stats"] = end_page_stats()
+    return state
+
+def prefetch_source_task(md_file_info, output_dir, save_dir, base_path, previous, nav, full_render):
+    md_file = md_file_info["file_path"]
+    return read_source(md_file, get_source_outputs(md_file, output_dir, save_dir, base_path), previous or {}, nav, full_render)
+
+def generate_folder_index_task(page_index, output_dir, base_path, stats=None):
+    page = WORKER_PAGES[page_index]
+    start_page_stats(page["rel_path"])
+    generate_folder_index(Path(page["rel_path"]).parent, output_dir, WORKER_PAGES, page["sub_pages"], base_path, stats)
+    return end_page_stats()
+
+def run_batch(task, batch, prefetch=None):
+    """ Run a batch of tasks with sources read ahead and outputs written in the background."""
+    start_writers()
+    try:
+        if prefetch is None or PREFETCH_DEPTH <= 0:
+            return [task(*args) for args in batch]
+        results = []
+        with ThreadPoolExecutor(max_workers=max(1, min(PREFETCH_DEPTH, 4))) as readers:
+            upcoming = iter(batch)
+            pending = deque((args, readers.submit(prefetch, *args)) for args in islice(upcoming, PREFETCH_DEPTH))
+            while pending:
+                args, prefetched = pending.popleft()
+                for next_args in islice(upcoming, 1):
+                    pending.append((next_args, readers.submit(prefetch, *next_args)))
+                results.append(task(*args, prefetched=prefetched))
+        return results
+    finally:
+        stop_writers()
+
+def run_sink_batch(task, batch, prefetch=None):
+    """ Run a batch in a worker process, and return its outputs along with its results."""
+    global OUTPUT_SINK
+    OUTPUT_SINK = MemorySink()
+    try:
+        return run_batch(task, batch, prefetch), OUTPUT_SINK.members
+    finally:
+        OUTPUT_SINK = None
+
+def run_tasks(task, tasks_args, pages_hierarchy, jobs, label="pages", prefetch=None):
+    """ Run render tasks, serially or across a process pool sharing the pages hierarchy, and return their results.
+
+    Tasks are sent to the workers in batches, with a bounded number of batches in flight.
+    """
+    results = []
+    if jobs <= 1 or len(tasks_args) < 2:
+        init_worker(pages_hierarchy, get_worker_settings())
+        for start in range(0, len(tasks_args), TASK_BATCH_SIZE):
+            results += run_batch(task, tasks_args[start:start + TASK_BATCH_SIZE], prefetch)
+            show_progress(label, len(results), len(tasks_args))
+        return results
+    jobs = min(jobs, len(tasks_args))
+    batch_size = max(1, min(TASK_BATCH_SIZE, len(tasks_args) // (jobs * 4)))
+    batches = (tasks_args[start:start + batch_size] for start in range(0, len(tasks_args), batch_size))
+    # Forked workers would inherit the open archive, and write to it when exiting.
+    mp_context = multiprocessing.get_context("spawn") if OUTPUT_SINK is not None else None
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, mp_context=mp_context,
+                             initargs=(pages_hierarchy, get_worker_settings())) as executor:
+        # With an output sink, the outputs of the workers are added here, in the order of the batches.
+        run_worker_batch = run_batch if OUTPUT_SINK is None else run_sink_batch
+        pending = deque(executor.submit(run_worker_batch, task, batch, prefetch) for batch in islice(batches, jobs * 2))
+        while pending:
+            result = pending.popleft().result()
+            if OUTPUT_SINK is not None:
+                result, members = result
+                OUTPUT_SINK.add_members(members)
+            results += result
+            for batch in islice(batches, 1):
+                pending.append(executor.submit(run_worker_batch, task, batch, prefetch))
+            show_progress(label, len(results), len(tasks_args))
+    return results
+
+# Background writers of this process: a bounded queue drained by I/O threads.
+WRITE_QUEUE = None
+WRITER_THREADS = []
+WRITER_ERRORS = []
+
+# Temporary files of write_file_atomic: .{name}.{pid}.{thread id}.tmp
+TMP_FILE_PATTERN = re.compile(r"\..+\.\d+\.\d+\.tmp$")
+
+def write_file_atomic(file_path, data):
+    """ Write bytes (or byte chunks) through a temporary file renamed over the target, so that no half-written file is left."""
+    file_path = Path(file_path)
+    tmp_file = file_path.with_name(f".{file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_file, "wb") as f:
+            if isinstance(data, bytes):
+                f.write(data)
+            else:
+                f.writelines(data)
+        os.replace(tmp_file, file_path)
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(tmp_file)
+        raise
+
+# Precompressed formats written next to the outputs: PRECOMPRESS lists them (gz,br,zst) and "True" picks every available one.
+@lru_cache(maxsize=16)
+def get_precompress_formats(setting):
+    """ Return the formats to write, and the requested ones that are unknown or need a missing package."""
+    available = {"gz": gzip, "br": brotli, "zst": zstandard}
+    if setting in ("", "False"):
+        return (), ()
+    if setting == "True":
+        return tuple(name for name, module in available.items() if module is not None), ()
+    formats = []
+    skipped = []
+    for name in get_config_array(setting):
+        name = name.lstrip(".").lower()
+        name = {"gzip": "gz", "brotli": "br", "zstd": "zst"}.get(name, name)
+        if available.get(name) is None:
+            skipped.append(name)
+        elif name not in formats:
+            formats.append(name)
+    return tuple(formats), tuple(skipped)
+
+def compress_output(data, name):
+    level = PRECOMPRESS_LEVELS[name]
+    if name == "gz":
+        return gzip.compress(data, level, mtime=0)
+    if name == "br":
+        return brotli.compress(data, quality=level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+def get_precompressed(file_path, data):
+    """ Precompressed copies of an output as (path, bytes), none for small files and other file types."""
+    if len(data) < PRECOMPRESS_MIN_SIZE or not str(file_path).endswith(PRECOMPRESS_TYPES):
+        return []
+    return [(f"{file_path}.{name}", compress_output(data, name)) for name in get_precompress_formats(PRECOMPRESS)[0]]
+
+def is_precompressed(file_path, size, mtime=None):
+    """ Check that the precompressed copies of an output match its size, and are not older than mtime."""
+    compress = size >= PRECOMPRESS_MIN_SIZE
+    for name in get_precompress_formats(PRECOMPRESS)[0]:
+        try:
+            variant_mtime = os.stat(f"{file_path}.{name}").st_mtime_ns
+        except FileNotFoundError:
+            if compress:
+                return False
+            continue
+        if not compress or (mtime is not None and variant_mtime < mtime):
+            return False
+    return True
+
+def write_precompressed(file_path, data):
+    """ Write the precompressed copies of an output, and remove those of a file now too small."""
+    compressed = dict(get_precompressed(file_path, data))
+    for name in get_precompress_formats(PRECOMPRESS)[0]:
+        variant = f"{file_path}.{name}"
+        if variant in compressed:
+            write_file_atomic(variant, compressed[variant])
+        else:
+            with suppress(FileNotFoundError):
+                os.unlink(variant)
+
+def write_output_file(file_path, data):
+    """ Write an output with its precompressed copies, skipping them when it already holds the same bytes."""
+    if not get_precompress_formats(PRECOMPRESS)[0] or not str(file_path).endswith(PRECOMPRESS_TYPES):
+        write_file_atomic(file_path, data)
+        return
+    # Incremental builds only recompress the outputs that changed.
+    if is_same_content(file_path, data) and is_precompressed(file_path, len(data)):
+        return
+    write_file_atomic(file_path, data)
+    write_precompressed(file_path, data)
+
+# Precompress the files of a copied folder, across threads since the compressors release the GIL.
+def precompress_tree(directory, incremental=False):
+    """ Write the precompressed copies of the files of a folder and return how many files were compressed.
+
+    Incremental runs skip the files whose copies are not older than them.
+    """
+    if not get_precompress_formats(PRECOMPRESS)[0]:
+        return 0
+    def precompress_file(file_path):
+        if incremental:
+            stat = os.stat(file_path)
+            if is_precompressed(file_path, stat.st_size, stat.st_mtime_ns):
+                return False
+        with open(file_path, "rb") as f:
+            write_precompressed(file_path, f.read())
+        return True
+    files = [os.path.join(root, name) for root, _, names in os.walk(directory)
+             for name in sorted(names) if name.endswith(PRECOMPRESS_TYPES)]
+    with ThreadPoolExecutor(max_workers=get_jobs(JOBS)) as executor:
+        return sum(executor.map(precompress_file, files))
+
+# Remove the precompressed copies of the formats no longer written, left by a previous build.
+def remove_precompressed(directory, formats):
+    dropped = tuple(f".{name}" for name in PRECOMPRESS_LEVELS if name not in formats)
+    for root, _, names in os.walk(directory):
+        names = set(names)
+        for name in names:
+            base, extension = os.path.splitext(name)
+            if extension in dropped and base.endswith(PRECOMPRESS_TYPES) and base in names:
+                os.unlink(os.path.join(root, name))
+
+def write_output(file_path, data):
+    """ Write an output file, to the output sink if any, or in the background when writers are running."""
+    if OUTPUT_SINK is not None:
+        OUTPUT_SINK.add(file_path, data)
+        OUTPUT_SINK.add_members(get_precompressed(file_path, data))
+    elif WRITE_QUEUE is None:
+        write_output_file(file_path, data)
+    else:
+        WRITE_QUEUE.put((file_path, data))
+
+def write_output_stream(file_path, chunks):
+    """ Write an output from byte chunks and return its size. Archive builds still hold it in memory."""
+    if OUTPUT_SINK is not None:
+        data = b"".join(chunks)
+        write_output(file_path, data)
+        return len(data)
+    write_file_atomic(file_path, chunks)
+    for name in PRECOMPRESS_LEVELS:
+        with suppress(FileNotFoundError):
+            os.unlink(f"{file_path}.{name}")  # Large streamed pages are not precompressed.
+    return os.path.getsize(file_path)
+
+def drain_write_queue(write_queue):
+    while True:
+        item = write_queue.get()
+        if item is None:
+            return
+        try:
+            write_output_file(*item)
+        except Exception as e:
+            WRITER_ERRORS.append((item[0], e))
+
+def start_writers():
+    global WRITE_QUEUE
+    if WRITERS <= 0 or WRITE_QUEUE is not None or OUTPUT_SINK is not None:
+        return
+    WRITE_QUEUE = queue.Queue(maxsize=max(1, WRITE_QUEUE_DEPTH))
+    WRITER_ERRORS.clear()
+    for _ in range(WRITERS):
+        thread = threading.Thread(target=drain_write_queue, args=(WRITE_QUEUE,), daemon=True)
+        thread.start()
+        WRITER_THREADS.append(thread)
+
+def stop_writers():
+    """ Wait for the pending writes and stop the writers, raising the first write error."""
+    global WRITE_QUEUE
+    if WRITE_QUEUE is None:
+        return
+    for _ in WRITER_THREADS:
+        WRITE_QUEUE.put(None)
+    for thread in WRITER_THREADS:
+        thread.join()
+    WRITER_THREADS.clear()
+    WRITE_QUEUE = None
+    if WRITER_ERRORS:
+        file_path, error = WRITER_ERRORS[0]
+        WRITER_ERRORS.clear()
+        raise OSError(f"Failed to write '{file_path}': {error}") from error
+
+# Output sink of the build: None writes files, an ArchiveWriter streams them into one archive.
+OUTPUT_SINK = None
+
+def make_output_dir(directory):
+    if OUTPUT_SINK is None:
+        Path(directory).mkdir(parents=True, exist_ok=True)
+
+class MemorySink:
+    """ Outputs of a worker batch, sent back in order to the archive of the main process."""
+
+    def __init__(self):
+        self.members = []
+
+    def add(self, file_path, data):
+        self.members.append((str(file_path), data))
+
+    def add_members(self, members):
+        self.members.extend((str(file_path), data) for file_path, data in members)
+
+class ArchiveWriter:
+    """ Stream the outputs of a build into a .tar.gz, .tar.xz, .tar.bz2, .tar.zst, .tar or .zip archive.
+
+    Members are added in build order, with fixed timestamps, owners and permissions, so that
+    the same sources give the same archive. It is written to a temporary file renamed on close.
+    """
+
+    def __init__(self, archive_path, roots):
+        self.archive_path = Path(archive_path)
+        self.roots = [(Path(os.path.abspath(directory)), prefix) for directory, prefix in roots]
+        self.names = set()
+        self.tmp_path = self.archive_path.with_name(f".{self.archive_path.name}.{os.getpid()}.tmp")
+        name = self.archive_path.name.lower()
+        if not name.endswith((".zip", ".tar", ".tar.gz", ".tgz", ".tar.xz", ".tar.bz2", ".tar.zst")):
+            raise ValueError(f"Unsupported archive format '{self.archive_path.name}'.")
+        if name.endswith(".tar.zst") and zstandard is None:
+            raise ValueError("The zstandard package is needed to write .tar.zst archives.")
+        self.archive_path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.tmp_path, "wb")
+        self.compressor = None
+        if name.endswith(".zip"):
+            self.archive = zipfile.ZipFile(self.file, "w", zipfile.ZIP_DEFLATED)
+            return
+        if name.endswith((".tar.gz", ".tgz")):
+            self.compressor = gzip.GzipFile(filename="", mode="wb", fileobj=self.file, mtime=ARCHIVE_MTIME)
+        elif name.endswith(".tar.xz"):
+            self.compressor = lzma.LZMAFile(self.file, "wb")
+        elif name.endswith(".tar.bz2"):
+            self.compressor = bz2.BZ2File(self.file, "wb")
+        elif name.endswith(".tar.zst"):
+            self.compressor = zstandard.ZstdCompressor().stream_writer(self.file, closefd=False)
+        self.archive = tarfile.open(fileobj=self.compressor or self.file, mode="w|", format=tarfile.PAX_FORMAT)
+
+    def get_member_name(self, file_path):
+        file_path = Path(os.path.abspath(file_path))
+        for directory, prefix in self.roots:
+            if file_path.is_relative_to(directory):
+                return (Path(prefix) / file_path.relative_to(directory)).as_posix()
+        raise ValueError(f"'{file_path}' is outside of the archived folders.")
+
+    def add(self, file_path, data):
+        name = self.get_member_name(file_path)
+        if name in self.names:
+            print(f" Warning: '{name}' is already in the archive, skipped.")
+            return
+        self.names.add(name)
+        if isinstance(self.archive, zipfile.ZipFile):
+            info = zipfile.ZipInfo(name, date_time=time.gmtime(ARCHIVE_MTIME)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            self.archive.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = ARCHIVE_MTIME
+            info.mode = 0o644
+            self.archive.addfile(info, io.BytesIO(data))
+
+    def add_members(self, members):
+        for file_path, data in members:
+            self.add(file_path, data)
+
+    def close(self, keep=True):
+        """ Finish the archive, and move it in place unless keep is False."""
+        self.archive.close()
+        if self.compressor is not None:
+            self.compressor.close()
+        self.file.close()
+        if keep:
+            os.replace(self.tmp_path, self.archive_path)
+        else:
+            os.unlink(self.tmp_path)
+
+# Timings of the phases of the last build.
+BUILD_PHASES = []
+# Callables notified with each finished phase (e.g. by the benchmark suite).
+PHASE_LISTENERS = []
+
+def get_max_rss_kb():
+    """ Peak resident memory of this process and of its finished workers, in KB."""
+    if resource is None:
+        return None
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def start_phase(name):
+    """ End the running build phase, if any, and start the next one."""
+    end_phase()
+    BUILD_PHASES.append({"name": name, "start": time.perf_counter(), "start_rss_kb": get_max_rss_kb()})
+
+def end_phase():
+    if not BUILD_PHASES or "start" not in BUILD_PHASES[-1]:
+        return
+    phase = BUILD_PHASES[-1]
+    phase["seconds"] = time.perf_counter() - phase.pop("start")
+    # The peak is that of the whole process so far: a phase only shows its own memory when it raises it.
+    start_rss_kb = phase.pop("start_rss_kb")
+    phase["peak_rss_kb"] = get_max_rss_kb()
+    phase["rss_growth_kb"] = phase["peak_rss_kb"] - start_rss_kb if start_rss_kb is not None else None
+    for listener in PHASE_LISTENERS:
+        listener(phase)
+
+# Timings of the page being generated in this process, when collected.
+PAGE_STATS = None
+PAGE_TIMERS = ("read", "parse", "nav", "render", "write", "index")
+# Time of the last progress line.
+PROGRESS_TIME = 0
+
+def start_page_stats(page):
+    global PAGE_STATS
+    PAGE_STATS = {"page": page}
+
+def end_page_stats():
+    global PAGE_STATS
+    stats, PAGE_STATS = PAGE_STATS, None
+    return stats
+
+def record_page_time(timer, start):
+    if PAGE_STATS is not None:
+        PAGE_STATS[timer] = PAGE_STATS.get(timer, 0) + time.perf_counter() - start
+
+# Per-file messages, hidden in quiet mode.
+def log_file(message):
+    if QUIET == 'False':
+        print(message)
+
+def show_progress(label, done, total):
+    """ Throttled progress line replacing the per-file messages in quiet mode."""
+    global PROGRESS_TIME
+    if QUIET == 'False':
+        return
+    now = time.monotonic()
+    if done < total and now - PROGRESS_TIME < PROGRESS_INTERVAL:
+        return
+    PROGRESS_TIME = now
+    print(f"\r {label}: {done}/{total}", end="\n" if done >= total else "", flush=True)
+
+def get_build_report(pages_stats, search_stats=None, guarded=None):
+    """ Machine-readable report of the phases and pages of the last build."""
+    totals = {timer: sum(stats.get(timer, 0) for stats in pages_stats) for timer in PAGE_TIMERS}
+    totals["output_bytes"] = sum(stats.get("output_bytes", 0) for stats in pages_stats)
+    totals["pages"] = len(pages_stats)
+    def get_page_seconds(stats):
+        return sum(stats.get(timer, 0) for timer in PAGE_TIMERS)
+    return {
+        "app_version": APP_VERSION,
+        "date": DATE_TAG,
+        "jobs": get_jobs(JOBS),
+        "phases": BUILD_PHASES,
+        "totals": totals,
+        "slowest": [stats["page"] for stats in sorted(pages_stats, key=get_page_seconds, reverse=True)[:20]],
+        "search": search_stats,
+        "guarded": guarded or {},
+        "pages": pages_stats,
+    }
+
+# Make a folder hold the same files as another, only touching the files that differ.
+def sync_tree(source_dir, target_dir, move=False, keep=(), delete=True):
+    """ Copy (or move) the differing files of source_dir to target_dir and delete the extra ones.
+
+    Files and folders of target_dir listed in keep (relative to it) are never deleted, nor any file without delete.
+    """
+    source_dir, target_dir = Path(source_dir), Path(target_dir)
+    counts = {"written": 0, "unchanged": 0, "deleted": 0}
+    source_files = set()
+    for root, _, files in os.walk(source_dir):
+        for name in files:
+            source_file = Path(root) / name
+            relative_path = source_file.relative_to(source_dir)
+            source_files.add(relative_path)
+            target_file = target_dir / relative_path
+            if target_file.is_file() and filecmp.cmp(source_file, target_file, shallow=False):
+                counts["unchanged"] += 1
+                continue
+            if target_file.is_dir():
+                shutil.rmtree(target_file)
+            target_file.parent.mkdir(parents=True, exist_ok=True)
+            if move:
+                os.replace(source_file, target_file)
+            else:
+                shutil.copy2(source_file, target_file)
+            counts["written"] += 1
+    if not delete:
+        return counts
+    keep = {Path(path) for path in keep}
+    for root, dirs, files in os.walk(target_dir, topdown=False):
+        for name in files:
+            relative_path = (Path(root) / name).relative_to(target_dir)
+            if relative_path not in source_files and keep.isdisjoint((relative_path, *relative_path.parents)):
+                (Path(root) / name).unlink()
+                counts["deleted"] += 1
+        if Path(root) != target_dir and not any(Path(root).iterdir()):
+            Path(root).rmdir()
+    return counts
+
+# Get the base path of the project a file belongs to.
+def get_base_path(file_path):
+    return next(bp["path"] for bp in INCLUDE_PATHS if Path(file_path).is_relative_to(bp["path"]))
+
+# Settings that a build can change, with the parser of their environment variable.
+# INCLUDE_PATHS is parsed with the EXCLUDE_PATHS of the same build.
+CONFIG_SETTINGS = {
+    "LANG": clean_lang,
+    "EXCLUDE_PATHS": get_paths,
+    "SAVE_DIR": Path,
+    "OUTPUT_DIR": Path,
+    "TEMPLATE": str,
+    "BACKUP_DIR": get_user_path,
+    "BACKUP_KEEP": str,
+    "BACKUP_MAX_AGE_DAYS": str,
+    "ROOT_INDEX_TITLE": str,
+    "ROOT_INDEX_SUB_TITLE": str,
+    "ROOT_INDEX_PROJECT_NAME": str,
+    "ROOT_DISPLAY_MENU": str,
+    "ROOT_SPLASH_PAGE": str,
+    "INCREMENTAL": str,
+    "JOBS": str,
+    "NAV_MODE": str,
+    "CACHE_DIR": get_user_path,
+    "SCAN_CACHE": str,
+    "RESCAN": str,
+    "MARKDOWN_EXTENSIONS": str,
+    "MARKDOWN_EXTENSION_CONFIGS": str,
+    "FRAGMENT_CACHE": str,
+    "FRAGMENT_MEMORY_CACHE": int,
+    "BYTECODE_CACHE": str,
+    "QUIET": str,
+    "BUILD_REPORT": str,
+    "WRITERS": int,
+    "WRITE_QUEUE_DEPTH": int,
+    "PREFETCH_DEPTH": int,
+    "SYNC_OUTPUT": str,
+    "SHARD": str,
+    "MERGE_SHARDS": str,
+    "ARCHIVE": str,
+    "SOURCE_DATE_EPOCH": str,
+    "NAV_TITLE": str,
+    "THEME": str,
+    "USE_EXTERNAL_ASSETS": str,
+    "SEARCH": str,
+    "PRECOMPRESS": str,
+    "PRECOMPRESS_MIN_SIZE": int,
+    "ASSET_LINKS": str,
+    "ASSET_FINGERPRINT": str,
+    "MINIFY_ASSETS": str,
+    "REPRODUCIBLE": str,
+    "FOLDER_INDEX_PAGE_SIZE": int,
+    "FOLDER_INDEX_LAYOUT": str,
+    "MAX_FILE_SIZE": int,
+    "MAX_FILE_POLICY": parse_max_file_policy,
+    "CONVERT_TIMEOUT": float,
+}
+CONFIG_NAMES = tuple(CONFIG_SETTINGS) + (
+    "INCLUDE_PATHS", "debug", "THEME_MODE", "BUILD_DATE", "ARCHIVE_MTIME", "DATE_TAG", "DATE_TAG_HUMAN", "FOOTER", "JINJA_ENV",
+)
+
+class BuildConfig:
+    """ Settings of one build, so that builds with other settings don't need a fresh interpreter."""
+
+    def __init__(self, settings):
+        self.settings = dict(settings)
+
+    @classmethod
+    def current(cls):
+        """ Settings of the module: read from the environment at import time, and changed since."""
+        return cls({name: globals()[name] for name in CONFIG_NAMES})
+
+    @classmethod
+    def from_env(cls, environ=None, base=None):
+        """ Settings of base (the module settings by default), changed by the variables set in environ."""
+        environ = os.environ if environ is None else environ
+        settings = dict((base or cls.current()).settings)
+        for name, parse in CONFIG_SETTINGS.items():
+            if name in environ:
+                settings[name] = parse(environ[name])
+        if "INCLUDE_PATHS" in environ:
+            settings["INCLUDE_PATHS"] = parse_include_paths(environ["INCLUDE_PATHS"], settings["EXCLUDE_PATHS"])
+        settings["THEME_MODE"] = 'dark' if settings["THEME"] == 'dark' else 'light'
+        return cls(settings)
+
+    def replace(self, **settings):
+        return BuildConfig(dict(self.settings, **settings))
+
+    def with_date(self, now=None):
+        """ Same settings, dated now (or SOURCE_DATE_EPOCH when set) instead of when the module was imported."""
+        epoch = self.settings.get("SOURCE_DATE_EPOCH", "")
+        if now is None:
+            now = datetime.fromtimestamp(int(epoch), timezone.utc) if epoch else datetime.now()
+        date_tag_human = now.strftime("%Y-%m-%d at %H:%M:%S")
+        return self.replace(BUILD_DATE=now, DATE_TAG=now.strftime("%Y%m%d-%H%M%S"), DATE_TAG_HUMAN=date_tag_human,
+                            FOOTER=get_footer(date_tag_human), ARCHIVE_MTIME=int(epoch or ARCHIVE_DEFAULT_MTIME))
+
+# Builds change the module settings, one at a time.
+BUILD_LOCK = threading.RLock()
+
+class Builder:
+    """ Build a site with a BuildConfig. The module settings are restored after each build."""
+
+    def __init__(self, config=None):
+        self.config = config or BuildConfig.current()
+
+    @contextmanager
+    def use_config(self):
+        with BUILD_LOCK:
+            previous = {name: globals()[name] for name in self.config.settings}
+            globals().update(self.config.settings)
+            try:
+                yield
+            finally:
+                globals().update(previous)
+
+    def build(self):
+        """ Build the site and return whether it succeeded, with the duration of each phase."""
+        start = time.perf_counter()
+        with self.use_config():
+            built = run_build()
+            return {"ok": bool(built), "seconds": time.perf_counter() - start, "phases": list(BUILD_PHASES)}
+
 # Main site generation function.
-def generate_site():
+def generate_site(config=None):
+    """ Build the site with the module settings, or with a BuildConfig."""
+    return Builder(config).build()
+
+def run_build():
     global OUTPUT_DIR
+    BUILD_PHASES.clear()
     #print('OUTPUT_DIR', OUTPUT_DIR)
     if not directory_security_check(OUTPUT_DIR):
         print(f"Warning: OUTPUT_DIR '{OUTPUT_DIR}' is unsafe, resetting to 'docs'.")
         OUTPUT_DIR = Path("docs")
     
-    clean_dir(OUTPUT_DIR)
-    
-    save_dir = OUTPUT_DIR
-    if directory_security_check(SAVE_DIR) and SAVE_DIR != OUTPUT_DIR:
-        clean_dir(SAVE_DIR)
-        save_dir = SAVE_DIR
-    
     for project in INCLUDE_PATHS:
         if not Path(project["path"]).exists():
             print(f"Error: Source path '{project['path']}' does not exist.")
-            return
+            return False
     
+    if ARCHIVE:
+        return build_archive(Path(ARCHIVE))
+    if SHARD:
+        index, count = parse_shard(SHARD)
+        return build_shard(index, count)
+    if MERGE_SHARDS:
+        count = int(MERGE_SHARDS)
+        shard_dirs = [get_shard_dirs(index, count) for index in range(1, count + 1)]
+        if SYNC_OUTPUT != 'False':
+            return generate_synced_site(merge_shards, shard_dirs)
+        return merge_shards(shard_dirs)
+    
+    save_dir = get_save_dir()
+    manifest = load_manifest(OUTPUT_DIR, save_dir) if INCREMENTAL != 'False' else None
+    if manifest is None and SYNC_OUTPUT != 'False':
+        return generate_synced_site(build_site, None)
+    return build_site(manifest)
+
+# Build daemon: keeps the interpreter, the templates and the scan and Markdown caches warm between builds.
+def serve_daemon(socket_path, config=None, ready=None):
+    """ Serve build requests on a Unix socket until a "stop" request.
+
+    Each request is a JSON line: {"env": {...}, "cwd": "..."} builds with the daemon settings changed by env,
+    {"command": "stop"} stops the daemon. The answer is a JSON line with the result of Builder.build().
+    """
+    socket_path = Path(socket_path)
+    base_config = config or BuildConfig.current()
+    if not base_config.settings["FRAGMENT_MEMORY_CACHE"]:
+        base_config = base_config.replace(FRAGMENT_MEMORY_CACHE=DAEMON_FRAGMENT_MEMORY_CACHE)
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    with suppress(FileNotFoundError):
+        socket_path.unlink()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(socket_path))
+    server.listen()
+    print(f"{APP_NAME} daemon listening on {socket_path}")
+    if ready is not None:
+        ready.set()
+    try:
+        running = True
+        while running:
+            connection, _ = server.accept()
+            with connection, connection.makefile("rwb") as stream:
+                try:
+                    request = json.loads(stream.readline() or b"{}")
+                    if request.get("command") == "stop":
+                        running = False
+                        answer = {"ok": True}
+                    else:
+                        answer = run_daemon_build(base_config, request)
+                except Exception as e:
+                    print(f" Error: Build request failed: {e}")
+                    answer = {"ok": False, "error": str(e)}
+                stream.write(json.dumps(answer, default=str).encode("utf-8") + b"\n")
+                stream.flush()
+    finally:
+        server.close()
+        with suppress(FileNotFoundError):
+            socket_path.unlink()
+
+def run_daemon_build(base_config, request):
+    config = BuildConfig.from_env(request.get("env", {}), base_config).with_date()
+    with BUILD_LOCK:
+        previous_cwd = os.getcwd()
+        os.chdir(request.get("cwd") or previous_cwd)
+        try:
+            return Builder(config).build()
+        finally:
+            os.chdir(previous_cwd)
+
+def request_build(socket_path, env=None, cwd=None, command=None):
+    """ Send a request to a build daemon and return its answer."""
+    request = {"command": command} if command else {"env": env or {}, "cwd": str(cwd or os.getcwd())}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(socket_path))
+        with client.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode("utf-8") + b"\n")
+            stream.flush()
+            return json.loads(stream.readline())
+
+# Watch mode: detect changes with inotify on Linux, or by polling the file stats.
+class PollingWatcher:
+    """ Detect changed files by comparing their size and mtime, every WATCH_INTERVAL seconds."""
+
+    def __init__(self, roots):
+        self.roots = [Path(root) for root in roots]
+        self.files = self.get_files()
+
+    def get_files(self):
+        files = {}
+        for root in self.roots:
+            for folder, _, names in os.walk(root):
+                for name in names:
+                    path = os.path.join(folder, name)
+                    with suppress(OSError):
+                        stat = os.stat(path)
+                        files[path] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def wait(self, timeout=None):
+        """ Return the paths changed since the last call, or an empty set after timeout seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            files = self.get_files()
+            changes = {path for path in files.keys() | self.files.keys() if files.get(path) != self.files.get(path)}
+            self.files = files
+            if changes or (deadline is not None and time.monotonic() >= deadline):
+                return {Path(path) for path in changes}
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """ Detect changed files with the inotify API of Linux, watching every folder of the roots."""
+
+    EVENTS = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400 | 0x800
+    IS_DIR = 0x40000000
+    OVERFLOW = 0x4000
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, roots):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.roots = [Path(root) for root in roots]
+        self.folders = {}
+        for root in self.roots:
+            self.add_tree(root)
+
+    def add_tree(self, root):
+        for folder, _, _ in os.walk(root):
+            watch = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), self.EVENTS)
+            if watch >= 0:
+                self.folders[watch] = Path(folder)
+
+    def read_events(self):
+        changes = set()
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changes
+        offset = 0
+        while offset < len(data):
+            watch, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & self.OVERFLOW:
+                changes.update(self.roots)  # Events were lost, rebuild everything.
+                continue
+            folder = self.folders.get(watch)
+            if folder is None:
+                continue
+            path = folder / name if name else folder
+            changes.add(path)
+            if mask & self.IS_DIR and path.is_dir():
+                self.add_tree(path)
+        return changes
+
+    def wait(self, timeout=None):
+        """ Return the paths changed since the last call, or an empty set after timeout seconds."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        changes = self.read_events()
+        # Editors write in several steps, collect them as one change.
+        while select.select([self.fd], [], [], WATCH_INTERVAL / 5)[0]:
+            changes |= self.read_events()
+        return changes
+
+    def close(self):
+        os.close(self.fd)
+
+def get_watcher(roots):
+    if sys.platform.startswith("linux") and WATCH_POLL == 'False':
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError) as e:
+            print(f" Warning: inotify is not available ({e}), polling instead.")
+    return PollingWatcher(roots)
+
+# Live reload: pages served by the dev server listen to the build events.
+LIVE_RELOAD_SCRIPT = """<script>
+(function () {
+    var page = decodeURIComponent(location.pathname).replace(/^\\//, '');
+    if (page === '' || page.slice(-1) === '/') { page += 'index.html'; }
+    var events = new EventSource('/__docmd/events');
+    events.onmessage = function (event) {
+        var changes = JSON.parse(event.data);
+        if (changes.all || changes.pages.indexOf(page) >= 0) { location.reload(); }
+    };
+})();
+</script>
+"""
+
+class DevRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """ Serve the output folder, with the live reload script added to the pages."""
+
+    def do_GET(self):
+        if self.path == "/__docmd/events":
+            return self.send_events()
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, "index.html")
+        if not path.endswith(".html") or not os.path.isfile(path):
+            return super().do_GET()
+        with open(path, "rb") as f:
+            content = f.read()
+        position = content.rfind(b"</body>")
+        position = len(content) if position < 0 else position
+        content = content[:position] + LIVE_RELOAD_SCRIPT.encode("utf-8") + content[position:]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        events = self.server.add_listener()
+        try:
+            while not self.server.stopping:
+                try:
+                    message = f"data: {json.dumps(events.get(timeout=1))}\n\n"
+                except queue.Empty:
+                    message = ": keepalive\n\n"
+                self.wfile.write(message.encode("utf-8"))
+                self.wfile.flush()
+        except OSError:
+            pass  # The page was closed.
+        finally:
+            self.server.remove_listener(events)
+
+    def log_message(self, format, *args):
+        if debug:
+            super().log_message(format, *args)
+
+class DevServer(http.server.ThreadingHTTPServer):
+    """ Local HTTP server of the watch mode, pushing the changed pages to the open ones."""
+
+    daemon_threads = True
+
+    def __init__(self, output_dir, port=0, host="127.0.0.1"):
+        super().__init__((host, port), functools.partial(DevRequestHandler, directory=str(output_dir)))
+        self.listeners = []
+        self.listeners_lock = threading.Lock()
+        self.stopping = False
+
+    def add_listener(self):
+        events = queue.Queue()
+        with self.listeners_lock:
+            self.listeners.append(events)
+        return events
+
+    def remove_listener(self, events):
+        with self.listeners_lock:
+            self.listeners.remove(events)
+
+    def notify(self, changes):
+        with self.listeners_lock:
+            for events in self.listeners:
+                events.put(changes)
+
+    def stop(self):
+        self.stopping = True
+        self.shutdown()
+        self.server_close()
+
+def get_output_files(output_dir):
+    """ Size and mtime of the files of a folder, by path relative to it."""
+    files = {}
+    for folder, _, names in os.walk(output_dir):
+        for name in names:
+            path = os.path.join(folder, name)
+            with suppress(OSError):
+                stat = os.stat(path)
+                files[Path(os.path.relpath(path, output_dir)).as_posix()] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+# Outputs that need no reload: build state, search data (fetched on each query) and precompressed copies.
+def is_reload_ignored(path):
+    return (path in (MANIFEST_FILE, SEARCH_CACHE_FILE, BUILD_INFO_FILE) or path.startswith(f"{SEARCH_PATH}/")
+            or path.rsplit(".", 1)[-1] in PRECOMPRESS_LEVELS)
+
+def get_output_changes(before, after):
+    """ Live reload event of a build: the changed pages, or all of them when an asset changed."""
+    changed = {path for path in before.keys() | after.keys() if before.get(path) != after.get(path) and not is_reload_ignored(path)}
+    if any(not path.endswith((".html", ".md")) for path in changed):
+        return {"all": True, "pages": sorted(changed)}
+    return {"all": False, "pages": sorted(path for path in changed if path.endswith(".html"))}
+
+def watch_site(config=None, serve=True, port=None, stop=None, on_build=None):
+    """ Rebuild the site incrementally on every change of the sources, templates or static assets.
+
+    Saving a page only renders it again, adding or removing one renders the pages whose navigation
+    changes, and a template change renders every page, with a process pool unless JOBS is set.
+    The builds run until stop (a threading.Event) is set, or Ctrl+C.
+    """
+    config = (config or BuildConfig.current()).replace(INCREMENTAL='True')
+    settings = config.settings
+    loader = settings["JINJA_ENV"].loader
+    template_dirs = [Path(path) for path in getattr(loader, "searchpath", [])]
+    output_dirs = {Path(os.path.abspath(settings["OUTPUT_DIR"])), Path(os.path.abspath(settings["SAVE_DIR"]))}
+    roots = [Path(project["path"]) for project in settings["INCLUDE_PATHS"]] + template_dirs + [Path("static")]
+    roots = [root for root in roots if root.exists()]
+
+    def is_watched(path):
+        path = Path(os.path.abspath(path))
+        if any(path == output_dir or output_dir in path.parents for output_dir in output_dirs):
+            return False
+        if any(path.is_relative_to(os.path.abspath(root)) for root in template_dirs + [Path("static")]):
+            return True
+        return path.suffix == ".md" or not path.suffix
+
+    def build(jobs):
+        before = get_output_files(settings["OUTPUT_DIR"])
+        result = Builder(config.replace(JOBS=jobs)).build()
+        result["changes"] = get_output_changes(before, get_output_files(settings["OUTPUT_DIR"]))
+        if server is not None:
+            server.notify(result["changes"])
+        if on_build is not None:
+            on_build(result)
+        return result
+
+    server = None
+    # Watch from before the first build, so that no change is missed.
+    watcher = get_watcher(roots)
+    try:
+        build(settings["JOBS"])
+        if serve:
+            server = DevServer(settings["OUTPUT_DIR"], WATCH_PORT if port is None else port)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            print(f"\nServing {settings['OUTPUT_DIR']} on http://{server.server_address[0]}:{server.server_address[1]}/")
+        print(f"Watching {', '.join(str(root) for root in roots)} (Ctrl+C to stop).")
+        while stop is None or not stop.is_set():
+            changes = {path for path in watcher.wait(timeout=1) if is_watched(path)}
+            if not changes:
+                continue
+            template_changed = any(Path(os.path.abspath(path)).is_relative_to(os.path.abspath(root)) for path in changes for root in template_dirs)
+            print(f"\n{len(changes)} change(s) detected{', rendering every page' if template_changed else ''}.")
+            build(settings["JOBS"] if not template_changed or settings["JOBS"] != '1' else 'auto')
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        watcher.close()
+        if server is not None:
+            server.stop()
+
+# Folder receiving the Markdown copies.
+def get_save_dir():
+    if directory_security_check(SAVE_DIR) and SAVE_DIR != OUTPUT_DIR:
+        return SAVE_DIR
+    return OUTPUT_DIR
+
+def get_staging_dir(directory):
+    return directory.parent / f".{directory.name}.staging"
+
+# Temporarily build into other output folders.
+@contextmanager
+def use_output_dirs(output_dir, save_dir):
+    global OUTPUT_DIR, SAVE_DIR
+    previous_dirs = OUTPUT_DIR, SAVE_DIR
+    OUTPUT_DIR, SAVE_DIR = output_dir, save_dir
+    try:
+        yield
+    finally:
+        OUTPUT_DIR, SAVE_DIR = previous_dirs
+
+def generate_synced_site(build, *args):
+    """ Run build(*args) into staging folders, then only write, replace or delete the files that differ.
+
+    Unchanged files keep their mtime, so that deploys only transfer real changes.
+    """
+    output_dir, save_dir = OUTPUT_DIR, get_save_dir()
+    staged_dirs = {output_dir: get_staging_dir(output_dir), save_dir: get_staging_dir(save_dir)}
+    for staging_dir in staged_dirs.values():
+        if staging_dir.exists():
+            shutil.rmtree(staging_dir)
+    with use_output_dirs(staged_dirs[output_dir], staged_dirs[save_dir]):
+        built = build(*args)
+    if built:
+        start_phase("sync")
+        print("\nSync the output folders.")
+        for target_dir, staging_dir in staged_dirs.items():
+            counts = sync_tree(staging_dir, target_dir, move=True)
+            print(f" {target_dir}: {counts['written']} written, {counts['unchanged']} unchanged, {counts['deleted']} deleted.")
+        end_phase()
+    for staging_dir in staged_dirs.values():
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return built
+
+def build_archive(archive_path):
+    """ Build the whole site into a single archive, without writing the pages, the Markdown copies or the assets to disk."""
+    global OUTPUT_SINK
+    save_dir = get_save_dir()
+    # Markdown copies kept out of the output folder go to a folder of the same name.
+    roots = [(OUTPUT_DIR, ".")] + ([(save_dir, save_dir.name)] if save_dir != OUTPUT_DIR else [])
+    OUTPUT_SINK = ArchiveWriter(archive_path, roots)
+    built = False
+    try:
+        built = build_site(None)
+    finally:
+        archive, OUTPUT_SINK = OUTPUT_SINK, None
+        archive.close(keep=built)
+    if built:
+        print(f"\nArchive: {archive_path} ({len(archive.names)} files, {archive_path.stat().st_size} bytes).")
+    return built
+
+# Parse a shard specification, "i/N" with i from 1 to N.
+def parse_shard(value):
+    try:
+        index, count = (int(part) for part in str(value).split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}', expected i/N.")
+    if not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{value}', i must be between 1 and N.")
+    return index, count
+
+# Folders of a shard, next to the output folders so that every shard process shares them.
+def get_shard_dirs(index, count):
+    save_dir = get_save_dir()
+    shard_name = f"{index}-of-{count}"
+    output_shard = OUTPUT_DIR.parent / f".{OUTPUT_DIR.name}.shards" / shard_name
+    save_shard = output_shard if save_dir == OUTPUT_DIR else save_dir.parent / f".{save_dir.name}.shards" / shard_name
+    return output_shard, save_shard
+
+def build_shard(index, count):
+    """ Render the share of pages of one shard into its shard folders, to be combined by merge_shards()."""
+    shard_dirs = get_shard_dirs(index, count)
+    for shard_dir in set(shard_dirs):
+        if shard_dir.exists():
+            shutil.rmtree(shard_dir)
+    with use_output_dirs(*shard_dirs):
+        return build_site(None, shard=(index, count))
+
+def merge_shards(shard_dirs):
+    """ Combine the shard folders into the output folder, then add the static assets, the root index and the manifest."""
+    count = len(shard_dirs)
+    shard_manifests = []
+    for index, (output_shard, _) in enumerate(shard_dirs, 1):
+        shard_manifest = load_json_file(output_shard / MANIFEST_FILE)
+        if not isinstance(shard_manifest, dict) or shard_manifest.get("version") != MANIFEST_VERSION or shard_manifest.get("shard") != [index, count]:
+            print(f"Error: Shard {index}/{count} not found in '{output_shard}'.")
+            return False
+        shard_manifests.append(shard_manifest)
+    
+    start_phase("scan")
     md_files, pages_hierarchy = scan_markdown_files(INCLUDE_PATHS, EXCLUDE_PATHS)
+    end_phase()
+    load_build_template()
+    assets = load_static_assets()
+    load_generated_assets(pages_hierarchy, md_files)
+    build_fingerprint = get_build_fingerprint()
+    nav_fingerprint = get_nav_fingerprint(pages_hierarchy)
+    for index, shard_manifest in enumerate(shard_manifests, 1):
+        if shard_manifest["fingerprint"] != build_fingerprint or shard_manifest["nav"] != nav_fingerprint:
+            print(f"Error: Shard {index}/{count} was built from other sources or settings.")
+            return False
+    
+    clean_dir(OUTPUT_DIR)
+    save_dir = get_save_dir()
+    if save_dir != OUTPUT_DIR:
+        clean_dir(save_dir)
+    copy_static_assets(save_dir, pages_hierarchy, assets)
+    
+    start_phase("merge")
+    print(f"\nMerge {count} shards.")
+    sources = {}
+    indexes = {}
+    search_entries = {}
+    for (output_shard, save_shard), shard_manifest in zip(shard_dirs, shard_manifests):
+        (output_shard / MANIFEST_FILE).unlink()
+        if SEARCH != 'False':
+            search_entries.update(load_search_cache(output_shard))
+            with suppress(FileNotFoundError):
+                (output_shard / SEARCH_CACHE_FILE).unlink()
+        if save_shard != output_shard:
+            sync_tree(save_shard, save_dir, move=True, delete=False)
+        sync_tree(output_shard, OUTPUT_DIR, move=True, delete=False)
+        resolve_manifest_paths(shard_manifest, OUTPUT_DIR, save_dir)
+        sources.update(shard_manifest["sources"])
+        indexes.update(shard_manifest["indexes"])
+    for shard_dir in {shard_dir for dirs in shard_dirs for shard_dir in dirs}:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        with suppress(OSError):
+            shard_dir.parent.rmdir()
+    if len(sources) != len(md_files):
+        print(f"Warning: The shards hold {len(sources)} of {len(md_files)} sources.")
+    
+    start_phase("root_index")
+    print("\nGenerate root index.")
+    root_index = OUTPUT_DIR / "index.html"
+    indexes[str(root_index)] = get_page_nav_fingerprint(pages_hierarchy, "index.html", nav_fingerprint)
+    generate_root_index(OUTPUT_DIR, pages_hierarchy, [project["path"] for project in INCLUDE_PATHS])
+    if REPRODUCIBLE != 'False':
+        write_build_info(OUTPUT_DIR, len(sources) + len(indexes))
+    
+    if SEARCH != 'False':
+        start_phase("search")
+        if keeps_build_state():
+            save_search_cache(OUTPUT_DIR, search_entries)
+        print_search_stats(write_search_index(OUTPUT_DIR, search_entries, md_files))
+    print_guarded_sources(get_guarded_sources(sources))
+    
+    start_phase("manifest")
+    if keeps_build_state():
+        save_manifest(OUTPUT_DIR, save_dir=save_dir, manifest={
+            "version": MANIFEST_VERSION,
+            "fingerprint": build_fingerprint,
+            "nav": nav_fingerprint,
+            "sources": sources,
+            "indexes": indexes,
+            "precompress": list(get_precompress_formats(PRECOMPRESS)[0]),
+            "assets": assets,
+        })
+    end_phase()
+    return True
+
+def get_guarded_sources(sources):
+    """ Sources that hit a guard (too large, or too slow to convert), with the reason."""
+    return {path: state["guard"] for path, state in sources.items() if state.get("guard")}
+
+def print_guarded_sources(guarded):
+    if not guarded:
+        return
+    print(f"\nGuarded files ({len(guarded)}, MAX_FILE_POLICY={MAX_FILE_POLICY}):")
+    for path, guard in guarded.items():
+        print(f" {path}: {guard}")
+
+def print_search_stats(search_stats):
+    print(f"\nSearch index: {search_stats['documents']} pages, {search_stats['terms']} terms in {search_stats['shards']} shards, "
+          f"{search_stats['bytes']} bytes ({search_stats['written']} files written).")
+
+# Minify a stylesheet without changing its meaning: only comments and whitespace are removed, strings are kept as is.
+CSS_STRING = r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+CSS_COMMENTS = re.compile(rf'({CSS_STRING})|/\*.*?\*/', re.S)
+CSS_SPACES = re.compile(rf'({CSS_STRING})|\s*([{{}};,>])\s*|(\s+)')
+CSS_LAST_SEMICOLONS = re.compile(rf'({CSS_STRING})|;(}})')
+
+def minify_css(text):
+    text = CSS_COMMENTS.sub(lambda m: m.group(1) or " ", text)
+    text = CSS_SPACES.sub(lambda m: m.group(1) or m.group(2) or " ", text)
+    return CSS_LAST_SEMICOLONS.sub(lambda m: m.group(1) or m.group(2), text).strip()
+
+def minify_asset(name, data):
+    """ Minified bytes of a stylesheet, or of a script when rjsmin is installed. None for other files."""
+    if ".min." in name:
+        return None
+    try:
+        if name.endswith(".css"):
+            return minify_css(data.decode("utf-8")).encode("utf-8")
+        if name.endswith(".js") and rjsmin is not None:
+            return rjsmin.jsmin(data.decode("utf-8")).encode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    return None
+
+def get_fingerprinted_name(path, content_hash):
+    base, extension = os.path.splitext(path)
+    return f"{base}.{content_hash[:10]}{extension}"
+
+def read_static_asset(source_dir, path, minify):
+    with open(os.path.join(source_dir, path), "rb") as f:
+        data = f.read()
+    minified = minify_asset(path, data) if minify else None
+    return data if minified is None else minified, minified is not None
+
+def scan_static_assets(source_dir, previous=None):
+    """ Return the size, mtime and output hash of each static file, by path relative to source_dir.
+
+    Files with the size and mtime recorded by the previous build keep their hash without being read.
+    Stylesheets and scripts get a fingerprinted name with ASSET_FINGERPRINT.
+    """
+    previous = previous or {}
+    minify = MINIFY_ASSETS != 'False'
+    assets = {}
+    for root, dirs, names in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(names):
+            path = Path(os.path.relpath(os.path.join(root, name), source_dir)).as_posix()
+            stat = os.stat(os.path.join(root, name))
+            state = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "minify": minify}
+            old = previous.get(path, {})
+            if all(old.get(key) == value for key, value in state.items()) and old.get("hash"):
+                state.update(hash=old["hash"], minified=old.get("minified", False))
+            else:
+                data, state["minified"] = read_static_asset(source_dir, path, minify)
+                state["hash"] = hashlib.sha256(data).hexdigest()
+            if ASSET_FINGERPRINT != 'False' and name.endswith(ASSET_FINGERPRINT_TYPES):
+                state["output"] = get_fingerprinted_name(path, state["hash"])
+            assets[path] = state
+    return assets
+
+def load_static_assets(previous=None):
+    """ Scan the static assets and install the fingerprinted names used by the pages of the build."""
+    global ASSET_MANIFEST
+    assets = scan_static_assets(Path("static"), previous)
+    ASSET_MANIFEST = {path: state["output"] for path, state in assets.items() if "output" in state}
+    return assets
+
+def load_generated_assets(pages_hierarchy, md_files):
+    """ Install the content hashes of the generated assets, that the pages link to before they are written.
+
+    The search index is only written after the pages, so docs.js is versioned by its list of pages,
+    that the ids of the shards refer to, and the shards by the hashes it lists.
+    """
+    global ASSET_VERSIONS
+    ASSET_VERSIONS = {}
+    if NAV_MODE == 'client':
+        path = Path(NAV_SCRIPT_PATH).relative_to("static").as_posix()
+        ASSET_VERSIONS[path] = hashlib.sha256(get_nav_script(pages_hierarchy)).hexdigest()[:10]
+    if SEARCH != 'False':
+        path = Path(SEARCH_PATH, "docs.js").relative_to("static").as_posix()
+        ASSET_VERSIONS[path] = hashlib.sha256(get_search_docs_script(get_search_docs(md_files)).encode("utf-8")).hexdigest()[:10]
+
+# Ways of linking assets found to fail, by source and target device, so that they are not tried for every file.
+LINK_FAILURES = set()
+FICLONE = 0x40049409  # Linux ioctl cloning a file on copy-on-write filesystems (Btrfs, XFS).
+
+def link_asset(source, target):
+    """ Place a static file in the output as a reflink or a hardlink when possible, or else as a copy."""
+    with suppress(FileNotFoundError):
+        os.unlink(target)  # Never write through a previous link to the source.
+    if ASSET_LINKS != 'False':
+        devices = (os.stat(source).st_dev, os.stat(os.path.dirname(target)).st_dev)
+        if fcntl is not None and sys.platform.startswith("linux") and ("reflink", devices) not in LINK_FAILURES:
+            try:
+                with open(source, "rb") as source_file, open(target, "wb") as target_file:
+                    fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+                shutil.copystat(source, target)
+                return "reflink"
+            except OSError:
+                LINK_FAILURES.add(("reflink", devices))
+                with suppress(OSError):
+                    os.unlink(target)
+        if devices[0] == devices[1] and ("hardlink", devices) not in LINK_FAILURES:
+            try:
+                os.link(source, target)
+                return "hardlink"
+            except OSError:
+                LINK_FAILURES.add(("hardlink", devices))
+    shutil.copy2(source, target)
+    return "copy"
+
+def remove_stale_assets(target_dir, outputs, keep):
+    """ Delete the files of target_dir that are neither outputs nor kept, besides precompressed copies of those."""
+    kept_dirs = tuple(f"{path}/" for path in keep)
+    for root, _, names in os.walk(target_dir, topdown=False):
+        for name in names:
+            path = Path(os.path.relpath(os.path.join(root, name), target_dir)).as_posix()
+            base, extension = os.path.splitext(path)
+            if extension.lstrip(".") in PRECOMPRESS_LEVELS and (base in outputs or base in keep):
+                path = base
+            if path not in outputs and path not in keep and not path.startswith(kept_dirs):
+                os.unlink(os.path.join(root, name))
+        if root != str(target_dir) and not os.listdir(root):
+            os.rmdir(root)
+
+def copy_static_assets(save_dir, pages_hierarchy, assets, previous=None):
+    """ Copy the static assets that changed since the previous build, with their fingerprinted names.
+
+    Files are linked to the sources when possible, or written minified with MINIFY_ASSETS.
+    """
+    start_phase("static")
+    print("\nCopy the static assets folder.")
+    source_dir = Path("static")
+    target_dir = save_dir / "static"
+    previous = previous or {}
+    counts = {}
+    outputs = set()
+    placed = {}  # First output of each content, that files with the same content are linked to.
+    for path, state in assets.items():
+        names = [path] + ([state["output"]] if "output" in state else [])
+        outputs.update(names)
+        old = previous.get(path, {})
+        unchanged = OUTPUT_SINK is None and old.get("hash") == state["hash"]
+        data = None
+        for name in names:
+            target = target_dir / name
+            if unchanged and target.is_file():
+                counts["unchanged"] = counts.get("unchanged", 0) + 1
+                continue
+            make_output_dir(target.parent)
+            if state["minified"] or OUTPUT_SINK is not None:
+                data = data or read_static_asset(source_dir, path, state["minify"])[0]
+                write_output(target, data)
+                method = "minified" if state["minified"] else "written"
+            else:
+                method = link_asset(placed.get(state["hash"], source_dir / path), target)
+                placed.setdefault(state["hash"], target)
+            counts[method] = counts.get(method, 0) + 1
+    if ASSET_MANIFEST:
+        outputs.add(Path(ASSET_MANIFEST_PATH).relative_to("static").as_posix())
+        write_output(save_dir / ASSET_MANIFEST_PATH, json.dumps(ASSET_MANIFEST, indent=1, sort_keys=True).encode("utf-8"))
+    if OUTPUT_SINK is None:
+        keep = {Path(path).relative_to("static").as_posix() for path in (NAV_SCRIPT_PATH, SEARCH_PATH)}
+        remove_stale_assets(target_dir, outputs, keep)
+    print(" " + ", ".join(f"{count} {method}" for method, count in sorted(counts.items())) + ".")
+    if OUTPUT_SINK is None and get_precompress_formats(PRECOMPRESS)[0]:
+        count = precompress_tree(target_dir, incremental=bool(previous))
+        print(f" Precompressed {count} static file(s) ({', '.join(get_precompress_formats(PRECOMPRESS)[0])}).")
+    
+    if NAV_MODE == 'client':
+        write_nav_script(OUTPUT_DIR, pages_hierarchy)
+
+# Build the site in OUTPUT_DIR, from scratch or incrementally from a manifest.
+# A shard (i, N) only renders its share of the pages, without the static assets and the root index.
+def build_site(manifest, shard=None):
+    if manifest is None and OUTPUT_SINK is None:
+        clean_dir(OUTPUT_DIR)
+    
+    save_dir = get_save_dir()
+    if save_dir != OUTPUT_DIR and manifest is None and OUTPUT_SINK is None:
+        clean_dir(save_dir)
+    
+    start_phase("scan")
+    md_files, pages_hierarchy = scan_markdown_files(INCLUDE_PATHS, EXCLUDE_PATHS)
+    end_phase()
     if not md_files:
         print('Sources folders empty.')
-        return
+        return False
     
-    print("\nCopy the static assets folder.")
-    if os.path.exists(f"{save_dir}/static"):
-        shutil.rmtree(f"{save_dir}/static")
-    shutil.copytree("./static", f"{save_dir}/static")
+    load_build_template()
     
-    print("\nCopy MD files.")
-    for md_file in md_files:
-        base_path = next(bp["path"] for bp in INCLUDE_PATHS if md_file["file_path"].is_relative_to(bp["path"]))
-        save_md_file(md_file["file_path"], save_dir, base_path)
+    # Decide what needs to be rebuilt.
+    previous_sources = manifest["sources"] if manifest else {}
+    previous_search = load_search_cache(OUTPUT_DIR) if manifest and SEARCH != 'False' else {}
+    previous_indexes = manifest.get("indexes", {}) if manifest else {}
+    previous_assets = manifest.get("assets") if manifest else None
+    assets = load_static_assets(previous_assets)
+    load_generated_assets(pages_hierarchy, md_files)
+    build_fingerprint = get_build_fingerprint()
+    nav_fingerprint = get_nav_fingerprint(pages_hierarchy)
+    full_render = manifest is None or manifest.get("fingerprint") != build_fingerprint
+    precompress_formats, skipped_formats = get_precompress_formats(PRECOMPRESS)
+    for name in skipped_formats:
+        print(f" Warning: Precompressed format '{name}' is unknown or its package is not installed, skipped.")
+    if manifest is not None and manifest.get("precompress", []) != list(precompress_formats):
+        for directory in {OUTPUT_DIR, save_dir}:
+            remove_precompressed(directory, precompress_formats)
     
-    print("\nWrite HTML files.")
-    for md_file in md_files:
-        base_path = next(bp["path"] for bp in INCLUDE_PATHS if md_file["file_path"].is_relative_to(bp["path"]))
-        convert_md_to_html(md_file, OUTPUT_DIR, pages_hierarchy, base_path)
+    if shard is None:
+        copy_static_assets(save_dir, pages_hierarchy, assets, previous_assets)
+    else:
+        # Pages are dealt in scan order, which is the same in every shard.
+        md_files = md_files[shard[0] - 1::shard[1]]
+    
+    # Each source is read once to be copied, hashed and converted.
+    start_phase("sources")
+    jobs = get_jobs(JOBS)
+    print("\nCopy MD files and write HTML files.")
+    # Pages missing from the search index are converted again, unless a guard kept them out of it.
+    indexed = previous_search.keys() | {path for path, state in previous_sources.items() if state.get("guard")}
+    source_tasks = [
+        (md_file, OUTPUT_DIR, save_dir, get_base_path(md_file["file_path"]),
+         previous_sources.get(str(md_file["file_path"])) if SEARCH == 'False' or str(md_file["file_path"]) in indexed else None,
+         get_page_nav_fingerprint(pages_hierarchy, md_file["rel_path"], nav_fingerprint), full_render)
+        for md_file in md_files
+    ]
+    sources = {}
+    search_entries = {}
+    pages_stats = []
+    changed_count = rendered_count = 0
+    source_states = run_tasks(build_source_file_task, source_tasks, pages_hierarchy, jobs, prefetch=prefetch_source_task)
+    stop_convert_guard()
+    for md_file, state in zip(md_files, source_states):
+        stats = state.pop("stats")
+        if state["changed"] or state["rendered"]:
+            pages_stats.append(stats)
+        changed_count += state.pop("changed")
+        rendered_count += state.pop("rendered")
+        search_entry = state.pop("search", None) or (previous_search.get(str(md_file["file_path"])) if "guard" not in state else None)
+        if SEARCH != 'False' and search_entry:
+            search_entries[str(md_file["file_path"])] = search_entry
+        sources[str(md_file["file_path"])] = state
+    if manifest is not None:
+        print(f"\nIncremental build: {changed_count} changed source(s), {rendered_count} page(s) rendered.")
     
+    start_phase("indexes")
     print("\nGenerate folder indexes.")
-    for page in pages_hierarchy:
+    indexes = {}
+    index_tasks = []
+    for page_index, page in enumerate(pages_hierarchy):
+        if page["rel_path"] == "index.html":
+            continue  # The root entry is rendered by generate_root_index() below.
+        if shard is not None and page_index % shard[1] != shard[0] - 1:
+            continue
         try:
-            base_path = next(bp["path"] for bp in INCLUDE_PATHS if Path(page["target_path"]).is_relative_to(bp["path"]))
+            base_path = get_base_path(page["target_path"])
         except StopIteration:
             base_path = Path(INCLUDE_PATHS[0]["path"])
             print(f"Warning: Could not determine base_path for {page['target_path']}, using {base_path}")
         folder_path = Path(page["rel_path"]).parent
-        #print('OUTPUT_DIR', OUTPUT_DIR)
-        generate_folder_index(folder_path, OUTPUT_DIR, pages_hierarchy, page["sub_pages"], base_path)
+        output_file = OUTPUT_DIR / folder_path / "index.html"
+        # Sources were just stat-ed, so their sizes and mtimes come from their states.
+        stats = get_sub_pages_stats(page["sub_pages"], sources) if FOLDER_INDEX_LAYOUT == 'table' or is_reproducible() else None
+        index_fingerprint = get_folder_index_fingerprint(pages_hierarchy, page, nav_fingerprint, stats)
+        index_files = get_index_page_files(output_file, len(page["sub_pages"]))
+        indexes.update((index_file, index_fingerprint) for index_file in index_files)
+        if full_render or any(previous_indexes.get(f) != index_fingerprint or not os.path.exists(f) for f in index_files):
+            #print('OUTPUT_DIR', OUTPUT_DIR)
+            index_tasks.append((page_index, OUTPUT_DIR, base_path, stats))
+    pages_stats += run_tasks(generate_folder_index_task, index_tasks, pages_hierarchy, jobs, "folder indexes")
 
     # Générer l’index racine
-    print("\nGenerate root index.")
-    base_paths = [project["path"] for project in INCLUDE_PATHS]  # Liste des chemins de base
-    generate_root_index(OUTPUT_DIR, pages_hierarchy, base_paths)
+    root_index = OUTPUT_DIR / "index.html"
+    if shard is None:
+        start_phase("root_index")
+        print("\nGenerate root index.")
+        base_paths = [project["path"] for project in INCLUDE_PATHS]  # Liste des chemins de base
+        indexes[str(root_index)] = get_page_nav_fingerprint(pages_hierarchy, "index.html", nav_fingerprint)
+        if full_render or not root_index.exists() or previous_indexes.get(str(root_index)) != indexes[str(root_index)]:
+            start_page_stats("index.html")
+            generate_root_index(OUTPUT_DIR, pages_hierarchy, base_paths)
+            pages_stats.append(end_page_stats())
+        if REPRODUCIBLE != 'False':  # Sync mode alone keeps no build date.
+            write_build_info(OUTPUT_DIR, len(sources) + len(indexes))
+        elif manifest is not None and OUTPUT_SINK is None:
+            remove_stale_outputs([str(OUTPUT_DIR / BUILD_INFO_FILE)], [])
+    
+    search_stats = None
+    if SEARCH != 'False':
+        start_phase("search")
+        if OUTPUT_SINK is None and keeps_build_state(shard):
+            save_search_cache(OUTPUT_DIR, search_entries)
+        if shard is None:
+            search_stats = write_search_index(OUTPUT_DIR, search_entries, md_files)
+            print_search_stats(search_stats)
+    
+    # An archive is always built from scratch, it has no manifest.
+    if OUTPUT_SINK is None:
+        start_phase("manifest")
+        if manifest is not None:
+            previous_outputs = [o for state in previous_sources.values() for o in state.get("outputs", [])]
+            previous_outputs += list(previous_indexes)
+            current_outputs = [o for state in sources.values() for o in state["outputs"]] + list(indexes)
+            remove_stale_outputs(previous_outputs, current_outputs)
+        
+        if keeps_build_state(shard):
+            save_manifest(OUTPUT_DIR, save_dir=save_dir, manifest={
+                "version": MANIFEST_VERSION,
+                "fingerprint": build_fingerprint,
+                "nav": nav_fingerprint,
+                "sources": sources,
+                "indexes": indexes,
+                "precompress": list(precompress_formats),
+                **({"shard": list(shard)} if shard else {"assets": assets}),
+            })
+    end_phase()
+    
+    guarded = get_guarded_sources(sources)
+    print_guarded_sources(guarded)
+    if BUILD_REPORT:
+        save_json_file(BUILD_REPORT, get_build_report(pages_stats, search_stats, guarded))
+        print(f"\nBuild report: {BUILD_REPORT}")
+    return True
+
+# Command line arguments
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog=APP_NAME.lower(), description=APP_DESCRIPTION)
+    parser.add_argument("-j", "--jobs", help="Number of worker processes used to render pages ('auto' for all CPU cores).")
+    parser.add_argument("--rescan", action="store_true", help="Ignore the scan cache and walk the sources from scratch.")
+    parser.add_argument("--sync", action="store_true", help="Build into a staging folder and only write the files that changed.")
+    parser.add_argument("--archive", metavar="FILE", help="Write the site to a .tar.gz, .tar.xz, .tar.bz2, .tar.zst, .tar or .zip archive instead of a folder.")
+    parser.add_argument("--shard", metavar="I/N", type=parse_shard, help="Only render the I-th of N shares of the pages, into a shard folder next to the output.")
+    parser.add_argument("--merge-shards", metavar="N", type=int, help="Combine the N shard folders into the output folder.")
+    parser.add_argument("--watch", action="store_true", help="Rebuild on every change and serve the site with live reload.")
+    parser.add_argument("--port", type=int, help="Port of the watch mode server (WATCH_PORT, 8000 by default).")
+    parser.add_argument("--no-serve", action="store_true", help="Watch without serving the site.")
+    parser.add_argument("--daemon", action="store_true", help="Serve build requests on a Unix socket, keeping the caches warm.")
+    parser.add_argument("--request", action="store_true", help="Ask a running daemon to build, with the settings of this environment.")
+    parser.add_argument("--stop-daemon", action="store_true", help="Stop a running daemon.")
+    parser.add_argument("--socket", help="Socket of the daemon (DAEMON_SOCKET, ~/.docmd/docmd.sock by default).")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Show a progress line instead of every generated file.")
+    parser.add_argument("--report", help="Write a JSON build report with phase and per-page timings to this file.")
+    parser.add_argument("--profile", help="Dump cProfile statistics of the build to this file.")
+    parser.add_argument("--list-backups", action="store_true", help="List the snapshots of the backup store.")
+    parser.add_argument("--restore", metavar="SNAPSHOT", help="Restore a snapshot of the backup store instead of building.")
+    parser.add_argument("--restore-to", metavar="DIR", help="Folder to restore the snapshot to (its original folder by default).")
+    return parser.parse_args(argv)
 
 # Main function
+def main(argv=None):
+    global JOBS, RESCAN, QUIET, BUILD_REPORT, PROFILE, SYNC_OUTPUT, SHARD, MERGE_SHARDS, ARCHIVE
+    args = parse_args(argv)
+    if args.archive:
+        ARCHIVE = args.archive
+    if args.shard:
+        SHARD = "/".join(map(str, args.shard))
+    if args.merge_shards:
+        MERGE_SHARDS = str(args.merge_shards)
+    if args.sync:
+        SYNC_OUTPUT = 'True'
+    if args.jobs is not None:
+        JOBS = args.jobs
+    if args.rescan:
+        RESCAN = 'True'
+    if args.quiet:
+        QUIET = 'True'
+    if args.report:
+        BUILD_REPORT = args.report
+    if args.profile:
+        PROFILE = args.profile
+    if args.list_backups:
+        for snapshot in get_snapshots():
+            created = datetime.fromtimestamp(snapshot["created"]).strftime("%Y-%m-%d %H:%M:%S")
+            print(f" {snapshot['id']}  {created}  {len(snapshot['files'])} files  {snapshot['source']}")
+        return
+    if args.restore:
+        restore_snapshot(args.restore, args.restore_to)
+        return
+    if args.watch:
+        watch_site(serve=not args.no_serve, port=args.port)
+        return
+    socket_path = Path(args.socket) if args.socket else DAEMON_SOCKET
+    if args.daemon:
+        serve_daemon(socket_path)
+        return
+    if args.request or args.stop_daemon:
+        env = {name: os.environ[name] for name in list(CONFIG_SETTINGS) + ["INCLUDE_PATHS"] if name in os.environ}
+        answer = request_build(socket_path, env, command="stop" if args.stop_daemon else None)
+        if "seconds" in answer:
+            print(f" Build {'done' if answer['ok'] else 'failed'} in {answer['seconds']:.2f}s.")
+        elif "error" in answer:
+            print(f" Error: {answer['error']}")
+        return 0 if answer["ok"] else 1
+    if PROFILE:
+        # Only the main process is profiled, use --jobs 1 to include the rendering.
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            generate_site()
+        finally:
+            profiler.disable()
+            profiler.dump_stats(PROFILE)
+            print(f"\nProfile: {PROFILE}")
+    else:
+        generate_site()
+
 if __name__ == "__main__":
-    generate_site()
+    sys.exit(main())
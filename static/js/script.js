@@ -1,3 +1,213 @@
 
 
 console.log('Script loaded');
+
+// Client-side navigation (NAV_MODE=client): build the sidebar from the shared nav.js tree.
+(function () {
+    var nav = window.DOCMD_NAV;
+    var container = document.querySelector('[data-docmd-nav]');
+    if (!nav || !container) {
+        return;
+    }
+    var currentPage = container.getAttribute('data-current-page');
+    var root = container.getAttribute('data-root') || '.';
+
+    function encodePath(path) {
+        return path.split('/').map(encodeURIComponent).join('/');
+    }
+
+    function getHref(path) {
+        return encodePath(root === '.' ? path : root + '/' + path);
+    }
+
+    function getStateClass(isActive, isCurrent) {
+        return (isActive ? ' active' : '') + (isCurrent ? ' current' : '');
+    }
+
+    function createItem(path, title, isFolder, isActive, isCurrent, itemClass) {
+        var item = document.createElement('li');
+        item.className = 'nav-item' + getStateClass(isActive, isCurrent) + ' ' + itemClass;
+        var link = document.createElement('a');
+        link.className = 'nav-link' + getStateClass(isActive, isCurrent);
+        link.href = getHref(path);
+        if (isFolder) {
+            var strong = document.createElement('strong');
+            strong.textContent = title;
+            link.appendChild(strong);
+        } else {
+            link.textContent = title;
+        }
+        item.appendChild(link);
+        return item;
+    }
+
+    var fragment = document.createDocumentFragment();
+    nav.projects.forEach(function (project, projectIndex) {
+        var block = document.createElement('div');
+        block.className = 'project-' + (projectIndex + 1);
+        var heading = document.createElement('h3');
+        heading.className = 'px-3';
+        heading.textContent = project[0];
+        block.appendChild(heading);
+        var list = document.createElement('ul');
+        list.className = 'nav flex-column';
+        project[1].forEach(function (page, pageIndex) {
+            var subPages = page[3];
+            var isCurrent = page[0] === currentPage;
+            var hasCurrentSub = subPages.some(function (sub) { return sub[0] === currentPage; });
+            var item = createItem(page[0], page[1], page[2], isCurrent || hasCurrentSub, isCurrent, 'page-' + (pageIndex + 1));
+            if (subPages.length) {
+                var nested = document.createElement('ul');
+                nested.className = 'nav-nested';
+                subPages.forEach(function (sub, subIndex) {
+                    var isSubCurrent = sub[0] === currentPage;
+                    nested.appendChild(createItem(sub[0], sub[1], sub[2], isSubCurrent, isSubCurrent, 'subpage-' + (subIndex + 1)));
+                });
+                item.appendChild(nested);
+            }
+            list.appendChild(item);
+        });
+        block.appendChild(list);
+        var separator = document.createElement('hr');
+        separator.className = 'project-separator';
+        block.appendChild(separator);
+        fragment.appendChild(block);
+    });
+    container.appendChild(fragment);
+})();
+
+// Search (SEARCH=True): look the query up in the prebuilt index, loading only the shards of its terms.
+(function () {
+    var container = document.querySelector('[data-docmd-search]');
+    if (!window.DOCMD_SEARCH_DOCS || !container) {
+        return;
+    }
+    var docs = window.DOCMD_SEARCH_DOCS;
+    var versions = window.DOCMD_SEARCH_SHARDS || {};
+    var input = container.querySelector('input');
+    var results = container.querySelector('.search-results');
+    var root = container.getAttribute('data-root') || '.';
+    var assets = container.getAttribute('data-assets');
+    var maxResults = 10;
+    var shards = {};
+    var pending = {};
+
+    // Called by each shard script.
+    window.DOCMD_SEARCH_SHARD = function (prefix, terms) {
+        shards[prefix] = terms;
+        (pending[prefix] || []).forEach(function (callback) { callback(); });
+        delete pending[prefix];
+    };
+
+    function loadShard(prefix, callback) {
+        if (shards[prefix] || !versions[prefix]) {
+            callback();
+            return;
+        }
+        if (pending[prefix]) {
+            pending[prefix].push(callback);
+            return;
+        }
+        pending[prefix] = [callback];
+        var script = document.createElement('script');
+        script.src = assets + '/search/' + encodeURIComponent(prefix) + '.js?v=' + versions[prefix];
+        script.onerror = function () { window.DOCMD_SEARCH_SHARD(prefix, {}); };
+        document.head.appendChild(script);
+    }
+
+    // Same terms as the index (get_search_terms): lowercase words of 2 characters or more, without accents.
+    function getTerms(text) {
+        return text.toLowerCase().normalize('NFKD').replace(/[\u0300-\u036f]/g, '').split(/[^\p{L}\p{M}\p{N}]+/u).filter(function (term) {
+            return Array.from(term).length >= 2;
+        });
+    }
+
+    // Shard of a term, by its first characters (not UTF-16 units).
+    function getPrefix(term) {
+        return Array.from(term).slice(0, 2).join('');
+    }
+
+    function addPostings(scores, postings) {
+        for (var i = 0; i < postings.length; i += 2) {
+            scores[postings[i]] = (scores[postings[i]] || 0) + postings[i + 1];
+        }
+    }
+
+    // Pages holding every term, the last one being a prefix while typing.
+    function getScores(terms) {
+        var scores = null;
+        terms.forEach(function (term, index) {
+            var shard = shards[getPrefix(term)] || {};
+            var termScores = {};
+            if (index === terms.length - 1) {
+                Object.keys(shard).forEach(function (key) {
+                    if (key.indexOf(term) === 0) {
+                        addPostings(termScores, shard[key]);
+                    }
+                });
+            } else if (shard[term]) {
+                addPostings(termScores, shard[term]);
+            }
+            if (scores === null) {
+                scores = termScores;
+                return;
+            }
+            Object.keys(scores).forEach(function (doc) {
+                if (doc in termScores) {
+                    scores[doc] += termScores[doc];
+                } else {
+                    delete scores[doc];
+                }
+            });
+        });
+        return scores || {};
+    }
+
+    function getHref(path) {
+        var href = path.split('/').map(encodeURIComponent).join('/');
+        return root === '.' ? href : root + '/' + href;
+    }
+
+    function showResults(scores) {
+        results.textContent = '';
+        var ids = Object.keys(scores).sort(function (a, b) { return scores[b] - scores[a]; }).slice(0, maxResults);
+        if (!ids.length) {
+            var empty = document.createElement('li');
+            empty.className = 'nav-item search-empty';
+            empty.textContent = 'No results';
+            results.appendChild(empty);
+            return;
+        }
+        ids.forEach(function (id) {
+            var item = document.createElement('li');
+            item.className = 'nav-item';
+            var link = document.createElement('a');
+            link.className = 'nav-link';
+            link.href = getHref(docs[id][0]);
+            link.textContent = docs[id][1];
+            item.appendChild(link);
+            results.appendChild(item);
+        });
+    }
+
+    input.addEventListener('input', function () {
+        var query = input.value;
+        var terms = getTerms(query);
+        if (!terms.length) {
+            results.textContent = '';
+            return;
+        }
+        var prefixes = terms.map(getPrefix).filter(function (prefix, index, all) {
+            return all.indexOf(prefix) === index;
+        });
+        var remaining = prefixes.length;
+        prefixes.forEach(function (prefix) {
+            loadShard(prefix, function () {
+                remaining -= 1;
+                if (remaining === 0 && input.value === query) {
+                    showResults(getScores(terms));
+                }
+            });
+        });
+    });
+})();
@@ -1,14 +1,24 @@
 import os
 import shutil
 from pathlib import Path
+from datetime import datetime
 import unittest
 from unittest.mock import patch, mock_open
 import sys
 from jinja2 import Environment, FileSystemLoader
 import html
+import io
+import hashlib
+import json
+import contextlib
+import threading
+import time
+import queue
+import urllib.request
 
 sys.path.append(os.path.dirname(__file__))
 import docmd
+import bench_docmd
 
 def create_test_tree(base_dir):
     """Create a test directory structure with Markdown files."""
@@ -84,6 +94,7 @@ class TestDocMD(unittest.TestCase):
         docmd.generate_site()
         missing_files = check_generated_files(self.output_dir)
         self.assertEqual(len(missing_files), 0, f"Missing files: {missing_files}")
+        self.assertFalse((self.output_dir / docmd.MANIFEST_FILE).exists())  # Only kept for incremental builds.
         
         with open(self.output_dir / "index.html", "r", encoding="utf-8") as f:
             content = f.read()
@@ -123,6 +134,44 @@ class TestDocMD(unittest.TestCase):
         self.assertIn("module1/index.html", hierarchy_paths)
         self.assertNotIn("module3/index.html", hierarchy_paths)
 
+    def test_scan_prunes_excluded_folders(self):
+        """Test literal and glob exclusions while scanning."""
+        src1 = Path(self.include_paths[0]["path"])
+        (src1 / "node_modules" / "pkg").mkdir(parents=True)
+        (src1 / "node_modules" / "pkg" / "readme.md").write_text("# Vendored")
+        (src1 / "module1" / "build").mkdir(parents=True)
+        (src1 / "module1" / "build" / "out.md").write_text("# Build output")
+        projects = [dict(self.include_paths[0], excludes=[src1 / "node_modules", "*/build"]), self.include_paths[1]]
+
+        found = [f["rel_path"] for f in docmd.iter_markdown_files(projects, docmd.EXCLUDE_PATHS)]
+        self.assertIn("module1/doc.html", found)
+        self.assertNotIn("node_modules/pkg/readme.html", found)
+        self.assertNotIn("module1/build/out.html", found)
+
+        _, hierarchy = docmd.scan_markdown_files(projects, [""])
+        hierarchy_paths = [p["rel_path"] for p in hierarchy]
+        self.assertNotIn("node_modules/index.html", hierarchy_paths)
+        self.assertIn("module2/Sujet/index.html", hierarchy_paths)
+
+    def test_scan_cache(self):
+        """Test that a warm scan only lists folders whose mtime moved and matches a cold scan."""
+        settings = {"SCAN_CACHE": "True", "SCAN_CACHE_RACY_WINDOW": 0, "CACHE_DIR": self.test_dir / "cache"}
+        with patch.multiple(docmd, **settings):
+            cold = docmd.scan_markdown_files(self.include_paths, docmd.EXCLUDE_PATHS)
+            with patch("docmd.os.scandir", wraps=os.scandir) as scandir:
+                self.assertEqual(docmd.scan_markdown_files(self.include_paths, docmd.EXCLUDE_PATHS), cold)
+                self.assertEqual(scandir.call_count, 0)
+
+                module1 = Path(self.include_paths[0]["path"]) / "module1"
+                mtime = module1.stat().st_mtime_ns
+                (module1 / "new.md").write_text("# New doc")
+                os.utime(module1, ns=(mtime, mtime + 10**9))
+                warm = docmd.scan_markdown_files(self.include_paths, docmd.EXCLUDE_PATHS)
+                self.assertEqual(scandir.call_count, 1)
+            with patch.object(docmd, "RESCAN", "True"):
+                self.assertEqual(docmd.scan_markdown_files(self.include_paths, docmd.EXCLUDE_PATHS), warm)
+            self.assertIn("module1/new.html", [f["rel_path"] for f in warm[0]])
+
     def test_convert_md_to_html(self):
         """Test the conversion of a Markdown file to HTML."""
         md_file_info = {
@@ -131,7 +180,7 @@ class TestDocMD(unittest.TestCase):
             "title": "doc",
             "parent": "module1"
         }
-        with patch('builtins.open', mock_open(read_data="# Doc in module1")):
+        with patch('builtins.open', mock_open(read_data="# Doc in module1")), patch('docmd.write_output') as mock_write_output:
             with patch('docmd.JINJA_ENV') as mock_jinja_env:
                 mock_template = mock_jinja_env.get_template.return_value
                 mock_template.render.return_value = "<html>Test</html>"
@@ -150,26 +199,47 @@ class TestDocMD(unittest.TestCase):
                 mock_template.render.assert_called_once_with(
                     title="doc",
                     content="<h1>Doc in module1</h1>",
-                    lang=docmd.LANG,
                     pages=[],
                     current_page=current_page,
                     page_id=page_id,
                     body_class=body_class,
                     css_path=css_path,
                     theme_css_path=theme_css_path,
-                    theme_mode=docmd.THEME_MODE,
                     assets_path=assets_path,
-                    footer=docmd.FOOTER,
-                    date_tag_human=docmd.DATE_TAG_HUMAN,
                     file_hash=file_hash,
                     file_size=file_size,
                     bs_css_path=bs_css_path,
-                    nav_title=docmd.NAV_TITLE,
-                    app_name=docmd.APP_NAME,
-                    app_author=docmd.APP_AUTHOR,
-                    app_version=docmd.APP_VERSION,
-                    app_description=docmd.APP_DESCRIPTION
+                    root_path="..",
+                    breadcrumbs=[]
                 )
+                mock_jinja_env.globals.update.assert_called_with(docmd.get_template_globals())
+                mock_write_output.assert_called_once_with(self.output_dir / "module1" / "doc.html", b"<html>Test</html>")
+
+    def test_template_globals_and_bytecode_cache(self):
+        """Test the per-build template globals and the optional bytecode cache."""
+        with patch.multiple(docmd, BYTECODE_CACHE="True", CACHE_DIR=self.test_dir / "cache"):
+            env = docmd.create_jinja_env(docmd.TEMPLATE_DIR)
+            self.assertIsInstance(env.bytecode_cache, docmd.jinja2.FileSystemBytecodeCache)
+            with patch.object(docmd, "JINJA_ENV", env):
+                template = docmd.get_build_template()
+                self.assertIs(docmd.get_build_template(), template)
+                self.assertEqual(env.globals["app_version"], docmd.APP_VERSION)
+                self.assertEqual(env.globals["footer"], docmd.FOOTER)
+            self.assertTrue(any((self.test_dir / "cache" / "jinja").iterdir()))
+
+    def test_render_markdown_extensions_and_cache(self):
+        """Test the reusable converter with configured extensions and the fragment cache."""
+        settings = {"MARKDOWN_EXTENSIONS": "tables, fenced_code", "FRAGMENT_CACHE": "True", "CACHE_DIR": self.test_dir / "cache"}
+        md_content = "| a | b |\n|---|---|\n| 1 | 2 |\n"
+        with patch.multiple(docmd, **settings):
+            converter = docmd.get_markdown_converter()
+            self.assertIs(docmd.get_markdown_converter(), converter)
+            html_content = docmd.render_markdown(md_content)
+            self.assertIn("<table>", html_content)
+            with patch.object(converter[1], "convert") as convert:
+                self.assertEqual(docmd.render_markdown(md_content), html_content)
+                convert.assert_not_called()
+        self.assertNotIn("<table>", docmd.render_markdown(md_content))
 
     def test_navigation_active_state(self):
         docmd.generate_site()
@@ -203,5 +273,597 @@ class TestDocMD(unittest.TestCase):
             self.assertIn('class="nav-link active current" href="extra.html"', content)
             self.assertIn('class="nav-link active" href="Source2/index.html"', content)
 
+    def test_incremental_build(self):
+        """Test that an incremental build only touches changed pages."""
+        with patch.object(docmd, "INCREMENTAL", "True"):
+            docmd.generate_site()
+            manifest = docmd.load_manifest(self.output_dir)
+            self.assertIsNotNone(manifest)
+            self.assertEqual(len(manifest["sources"]), 5)
+            doc_mtime = (self.output_dir / "module1/doc.html").stat().st_mtime_ns
+
+            (self.test_dir / "src1/readme.md").write_text("# README updated")
+            docmd.generate_site()
+            with open(self.output_dir / "readme.html", "r", encoding="utf-8") as f:
+                self.assertIn("README updated", f.read())
+            self.assertEqual((self.output_dir / "module1/doc.html").stat().st_mtime_ns, doc_mtime)
+
+            (self.test_dir / "src1/module4/Special d.md").unlink()
+            docmd.generate_site()
+            self.assertFalse((self.output_dir / "module4/Special d.html").exists())
+            self.assertFalse((self.output_dir / "module4/Special d.md").exists())
+            self.assertFalse((self.output_dir / "module4/index.html").exists())
+            self.assertTrue((self.output_dir / "module1/doc.html").exists())
+
+    def test_synced_build(self):
+        """Test that a synced full build only rewrites the files that changed."""
+        with patch.object(docmd, "SYNC_OUTPUT", "True"):
+            docmd.generate_site()
+            doc_mtime = (self.output_dir / "module1/doc.html").stat().st_mtime_ns
+            css_mtime = (self.output_dir / "static/css/style.css").stat().st_mtime_ns
+
+            (self.test_dir / "src1/readme.md").write_text("# README synced")
+            # A later run has another build date, which must not rewrite the pages.
+            with patch.multiple(docmd, DATE_TAG_HUMAN="2030-01-01 at 00:00:00", FOOTER=docmd.get_footer("2030-01-01 at 00:00:00")):
+                docmd.generate_site()
+            with open(self.output_dir / "readme.html", "r", encoding="utf-8") as f:
+                self.assertIn("README synced", f.read())
+            self.assertEqual((self.output_dir / "module1/doc.html").stat().st_mtime_ns, doc_mtime)
+            self.assertEqual((self.output_dir / "static/css/style.css").stat().st_mtime_ns, css_mtime)
+
+            (self.test_dir / "src1/module4/Special d.md").unlink()
+            docmd.generate_site()
+            self.assertFalse((self.output_dir / "module4/Special d.html").exists())
+            self.assertFalse((self.output_dir / "module4").exists())
+            self.assertFalse(docmd.get_staging_dir(self.output_dir).exists())
+
+    def test_backup_store(self):
+        """Test that backups are deduplicated snapshots that can be pruned and restored."""
+        backup_dir = self.test_dir / "archives"
+        with patch.multiple(docmd, BACKUP_DIR=backup_dir, BACKUP_KEEP="2", BACKUP_MAX_AGE_DAYS="0"):
+            for _ in range(4):
+                docmd.generate_site()
+            snapshots = docmd.get_snapshots("docs")
+            self.assertEqual(len(snapshots), 2)
+            objects = [p for p in (backup_dir / "objects").rglob("*") if p.is_file()]
+            self.assertEqual(len(objects), len({file[0] for file in snapshots[-1]["files"].values()}))
+            # Static assets are hard links to the repository files: their objects must be copies.
+            style_object = docmd.get_backup_object(snapshots[-1]["files"]["static/css/style.css"][0])
+            self.assertFalse(os.path.samefile(style_object, "static/css/style.css"))
+
+            restore_dir = self.test_dir / "restored"
+            self.assertTrue(docmd.restore_snapshot(snapshots[-1]["id"], restore_dir))
+            self.assertEqual((restore_dir / "readme.html").read_bytes(), (self.output_dir / "readme.html").read_bytes())
+            self.assertEqual(check_generated_files(restore_dir), [])
+
+            docmd.prune_snapshots(keep=1)
+            self.assertEqual([s["id"] for s in docmd.get_snapshots("docs")], [snapshots[-1]["id"]])
+
+    def test_sharded_build_matches_full_build(self):
+        """Test that merged shards produce the same site as a single build."""
+        def snapshot():
+            return {str(p.relative_to(self.output_dir)): p.read_bytes()
+                    for p in sorted(self.output_dir.rglob("*")) if p.is_file() and p.name != docmd.MANIFEST_FILE}
+        docmd.generate_site()
+        full = snapshot()
+        shutil.rmtree(self.output_dir)
+        for shard in ("1/3", "2/3", "3/3"):
+            with patch.object(docmd, "SHARD", shard):
+                docmd.generate_site()
+        self.assertFalse(self.output_dir.exists())
+        with patch.multiple(docmd, MERGE_SHARDS="3", INCREMENTAL="True"):
+            docmd.generate_site()
+        self.assertEqual(snapshot(), full)
+        self.assertEqual(len(docmd.load_manifest(self.output_dir)["sources"]), 5)
+        self.assertFalse((self.test_dir / ".docs.shards").exists())
+        self.assertEqual(docmd.parse_args(["--shard", "2/3"]).shard, (2, 3))
+
+    def test_builder_config(self):
+        """Test that a BuildConfig only applies to its own build."""
+        other_dir = self.test_dir / "other"
+        config = docmd.BuildConfig.from_env({"OUTPUT_DIR": str(other_dir), "SAVE_DIR": str(other_dir), "NAV_TITLE": "Other",
+                                             "ROOT_INDEX_TITLE": "Other Home", "ROOT_INDEX_SUB_TITLE": "Other welcome"})
+        result = docmd.Builder(config).build()
+        self.assertTrue(result["ok"])
+        self.assertEqual(check_generated_files(other_dir), [])
+        with open(other_dir / "readme.html", "r", encoding="utf-8") as f:
+            self.assertIn("Other", f.read())
+        with open(other_dir / "index.html", "r", encoding="utf-8") as f:
+            content = f.read()
+        self.assertIn("<title>Other Home", content)
+        self.assertIn("<h2>Other welcome</h2>", content)
+        self.assertEqual(docmd.OUTPUT_DIR, self.output_dir)
+        self.assertNotEqual(docmd.NAV_TITLE, "Other")
+        self.assertFalse(self.output_dir.exists())
+
+    def test_daemon_builds(self):
+        """Test that the daemon builds on request, with the settings of each request."""
+        socket_path = self.test_dir / "docmd.sock"
+        ready = threading.Event()
+        daemon = threading.Thread(target=docmd.serve_daemon, args=(socket_path, None, ready))
+        with contextlib.redirect_stdout(io.StringIO()):
+            daemon.start()
+            try:
+                self.assertTrue(ready.wait(5))
+                answer = docmd.request_build(socket_path)
+                self.assertTrue(answer["ok"])
+                self.assertEqual(check_generated_files(self.output_dir), [])
+                other_dir = self.test_dir / "other"
+                answer = docmd.request_build(socket_path, {"OUTPUT_DIR": str(other_dir), "SAVE_DIR": str(other_dir)})
+                self.assertTrue(answer["ok"])
+                self.assertEqual(check_generated_files(other_dir), [])
+                self.assertFalse(docmd.request_build(socket_path, {"SHARD": "5/2"})["ok"])
+                archives = [self.test_dir / f"site{index}.tar.gz" for index in (1, 2)]
+                for archive in archives:
+                    time.sleep(1.1)  # Another build date, unless SOURCE_DATE_EPOCH is used.
+                    answer = docmd.request_build(socket_path, {"ARCHIVE": str(archive), "SOURCE_DATE_EPOCH": "1700000000"})
+                    self.assertTrue(answer["ok"])
+                self.assertEqual(archives[0].read_bytes(), archives[1].read_bytes())
+            finally:
+                docmd.request_build(socket_path, command="stop")
+                daemon.join(5)
+        self.assertFalse(socket_path.exists())
+
+    def test_watchers_detect_changes(self):
+        """Test that the watchers report created and modified files."""
+        watchers = [docmd.PollingWatcher]
+        if sys.platform.startswith("linux"):
+            watchers.append(docmd.InotifyWatcher)
+        for watcher_class in watchers:
+            with self.subTest(watcher=watcher_class.__name__):
+                watcher = watcher_class([self.test_dir / "src1"])
+                try:
+                    time.sleep(0.01)
+                    (self.test_dir / "src1/readme.md").write_text(f"# {watcher_class.__name__}")
+                    (self.test_dir / "src1/module3/new.md").write_text("# New")
+                    changes = set()
+                    for _ in range(10):
+                        changes |= watcher.wait(timeout=0.5)
+                        if len(changes) >= 2:
+                            break
+                    self.assertIn(self.test_dir / "src1/readme.md", changes)
+                    self.assertIn(self.test_dir / "src1/module3/new.md", changes)
+                finally:
+                    watcher.close()
+
+    def test_watch_rebuilds_changed_pages(self):
+        """Test that the watch mode renders the saved page only and pushes it to the open pages."""
+        builds = queue.Queue()
+        stop = threading.Event()
+        watch = threading.Thread(target=docmd.watch_site, kwargs={"port": 0, "stop": stop, "on_build": builds.put})
+        # The search data and build-info.json change on every build but are no reason to reload every page.
+        with contextlib.redirect_stdout(io.StringIO()), patch.multiple(docmd, WATCH_POLL="True", WATCH_INTERVAL=0.05,
+                                                                       SEARCH="True", REPRODUCIBLE="True"):
+            watch.start()
+            try:
+                self.assertTrue(builds.get(timeout=10)["ok"])
+                (self.test_dir / "src1/module1/doc.md").write_text("# Doc saved")
+                changes = builds.get(timeout=10)["changes"]
+                self.assertFalse(changes["all"])
+                self.assertIn("module1/doc.html", changes["pages"])
+                self.assertNotIn("readme.html", changes["pages"])
+                self.assertEqual(docmd.get_output_changes({}, {"readme.html.gz": 1, "static/search/re.js": 1}),
+                                 {"all": False, "pages": []})
+            finally:
+                stop.set()
+                watch.join(10)
+
+    def test_dev_server_live_reload(self):
+        """Test that the dev server adds the reload script and pushes build events."""
+        docmd.generate_site()
+        server = docmd.DevServer(self.output_dir)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            with urllib.request.urlopen(f"{url}/readme.html") as response:
+                self.assertIn("/__docmd/events", response.read().decode("utf-8"))
+            with urllib.request.urlopen(f"{url}/__docmd/events") as events:
+                for _ in range(50):
+                    if server.listeners:
+                        break
+                    time.sleep(0.05)
+                server.notify({"all": False, "pages": ["readme.html"]})
+                line = events.readline()
+                while line.startswith(b":"):
+                    events.readline()
+                    line = events.readline()
+                self.assertEqual(json.loads(line[len(b"data: "):]), {"all": False, "pages": ["readme.html"]})
+        finally:
+            server.stop()
+
+    def test_search_index(self):
+        """Test that the search index is built with the pages and only rewritten where it changed."""
+        report_file = self.test_dir / "report.json"
+        search_dir = self.output_dir / docmd.SEARCH_PATH
+        def load_shard(prefix):
+            content = (search_dir / f"{prefix}.js").read_text(encoding="utf-8")
+            return json.loads(content[content.index(",") + 1:content.rindex(")")])
+        with patch.multiple(docmd, SEARCH="True", INCREMENTAL="True", BUILD_REPORT=str(report_file)), \
+                contextlib.redirect_stdout(io.StringIO()):
+            docmd.generate_site()
+            with open(report_file, "r", encoding="utf-8") as f:
+                search = json.load(f)["search"]
+            self.assertEqual(search["documents"], 5)
+            self.assertEqual(search["written"], search["shards"] + 1)
+            docs_lines = (search_dir / "docs.js").read_text(encoding="utf-8").splitlines()
+            docs, versions = (json.loads(line[line.index("=") + 1:-1]) for line in docs_lines)
+            urls = [doc[0] for doc in docs]
+            self.assertIn("readme.html", urls)
+            self.assertEqual(load_shard("re")["readme"][0], urls.index("readme.html"))
+            # Pages link docs.js by its list of pages, the shards are loaded by their content hash.
+            docs_version = hashlib.sha256(f"{docs_lines[0]}\n".encode("utf-8")).hexdigest()[:10]
+            with open(self.output_dir / "readme.html", "r", encoding="utf-8") as f:
+                content = f.read()
+            self.assertIn("data-docmd-search", content)
+            self.assertIn(f'src="static/search/docs.js?v={docs_version}"', content)
+            shard_data = (search_dir / "re.js").read_bytes()
+            self.assertEqual(versions["re"], hashlib.sha256(shard_data).hexdigest()[:10])
+
+            (self.test_dir / "src1/readme.md").write_text("# README at root\n\nZebra crossing")
+            docmd.generate_site()
+            with open(report_file, "r", encoding="utf-8") as f:
+                search = json.load(f)["search"]
+            self.assertEqual(search["written"], 3)  # The new "ze" and "cr" shards, and their hashes in docs.js.
+            self.assertEqual(load_shard("ze")["zebra"], [urls.index("readme.html"), 1])
+            with open(self.output_dir / "readme.html", "r", encoding="utf-8") as f:
+                self.assertIn(f'src="static/search/docs.js?v={docs_version}"', f.read())
+
+        self.assertEqual(docmd.get_search_terms("Déjà-vu, Привет ＭＩＲ! हिन्दी x"), ["deja", "vu", "привет", "mir", "हिन्दी"])
+
+    def test_archive_output(self):
+        """Test that archive builds hold the whole site, are reproducible and write no output folder."""
+        import tarfile
+        import zipfile
+        docmd.generate_site()
+        expected = {str(p.relative_to(self.output_dir)).replace(os.sep, "/"): p.read_bytes()
+                    for p in self.output_dir.rglob("*") if p.is_file() and p.name != docmd.MANIFEST_FILE}
+        shutil.rmtree(self.output_dir)
+        for name, jobs in (("site.tar.gz", "1"), ("site.zip", "1"), ("site-parallel.tar.gz", "2")):
+            with self.subTest(archive=name, jobs=jobs):
+                archive_path = self.test_dir / name
+                with patch.multiple(docmd, ARCHIVE=str(archive_path), JOBS=jobs), contextlib.redirect_stdout(io.StringIO()):
+                    docmd.generate_site()
+                self.assertFalse(self.output_dir.exists())
+                if name.endswith(".zip"):
+                    with zipfile.ZipFile(archive_path) as archive:
+                        members = {info.filename: archive.read(info) for info in archive.infolist()}
+                else:
+                    with tarfile.open(archive_path) as archive:
+                        members = {info.name: archive.extractfile(info).read() for info in archive.getmembers()}
+                self.assertEqual(members, expected)
+        first = (self.test_dir / "site.tar.gz").read_bytes()
+        with patch.object(docmd, "ARCHIVE", str(self.test_dir / "site.tar.gz")), contextlib.redirect_stdout(io.StringIO()):
+            docmd.generate_site()
+        self.assertEqual((self.test_dir / "site.tar.gz").read_bytes(), first)
+        self.assertEqual((self.test_dir / "site-parallel.tar.gz").read_bytes(), first)
+
+    def test_archive_over_output(self):
+        """Test that an archive build ignores an existing output folder, and leaves it untouched."""
+        import tarfile
+        def read_tree():
+            return {p: (p.read_bytes(), p.stat().st_mtime_ns) for p in self.output_dir.rglob("*") if p.is_file()}
+        def read_archive(archive_path):
+            with patch.object(docmd, "ARCHIVE", str(archive_path)), contextlib.redirect_stdout(io.StringIO()):
+                docmd.generate_site()
+            with tarfile.open(archive_path) as archive:
+                return {info.name: archive.extractfile(info).read() for info in archive.getmembers()}
+        with patch.multiple(docmd, SEARCH="True", NAV_MODE="client"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                docmd.generate_site()
+            self.assertTrue((self.output_dir / docmd.SEARCH_PATH / "ex.js").exists())
+            self.assertFalse((self.output_dir / docmd.SEARCH_CACHE_FILE).exists())
+            (self.test_dir / "src2/extra.md").unlink()
+            tree = read_tree()
+            members = read_archive(self.test_dir / "site.tar.gz")
+            self.assertEqual(read_tree(), tree)
+            for name in ("readme.md", "module1/doc.md", "static/js/nav.js", "static/search/docs.js", "static/search/re.js"):
+                self.assertIn(name, members)
+            self.assertNotIn("static/search/ex.js", members)
+            shutil.rmtree(self.output_dir)
+            self.assertEqual(read_archive(self.test_dir / "clean.tar.gz"), members)
+
+    def test_precompressed_output(self):
+        """Test that outputs get .gz copies, only recompressed when they change, and removed once disabled."""
+        import gzip
+        readme = self.output_dir / "readme.html"
+        def compressed():
+            return {p: p.stat().st_mtime_ns for p in self.output_dir.rglob("*.gz")}
+        with patch.multiple(docmd, PRECOMPRESS="gz", PRECOMPRESS_MIN_SIZE=200, INCREMENTAL="True"), \
+             contextlib.redirect_stdout(io.StringIO()):
+            docmd.generate_site()
+            first = compressed()
+            self.assertEqual(gzip.decompress(Path(f"{readme}.gz").read_bytes()), readme.read_bytes())
+            self.assertIn(self.output_dir / "static/css/style.css.gz", first)
+            self.assertNotIn(self.output_dir / "readme.md.gz", first)
+            self.assertTrue(all(Path(str(p)[:-3]).stat().st_size >= 200 for p in first))
+
+            time.sleep(0.01)
+            (Path(self.include_paths[0]["path"]) / "readme.md").write_text("# README at root\n\nChanged.")
+            docmd.generate_site()
+            second = compressed()
+            self.assertEqual([p for p in first if first[p] != second[p]], [Path(f"{readme}.gz")])
+            self.assertIn(b"Changed.", gzip.decompress(Path(f"{readme}.gz").read_bytes()))
+        with patch.multiple(docmd, INCREMENTAL="True"), contextlib.redirect_stdout(io.StringIO()):
+            docmd.generate_site()
+        self.assertEqual(compressed(), {})
+        self.assertTrue(readme.exists())
+
+    def test_static_asset_pipeline(self):
+        """Test fingerprinted and minified assets, only copied again when they change."""
+        static_dir = self.output_dir / "static"
+        with patch.multiple(docmd, ASSET_FINGERPRINT="True", MINIFY_ASSETS="True", INCREMENTAL="True"), \
+             contextlib.redirect_stdout(io.StringIO()):
+            docmd.generate_site()
+            manifest = json.loads((static_dir / "assets.json").read_text())
+            style = manifest["css/style.css"]
+            self.assertRegex(style, r"^css/style\.[0-9a-f]{10}\.css$")
+            self.assertEqual((static_dir / style).read_text(), docmd.minify_css(Path("static/css/style.css").read_text()))
+            self.assertLess((static_dir / style).stat().st_size, Path("static/css/style.css").stat().st_size)
+            self.assertEqual((static_dir / "img/logo.png").read_bytes(), Path("static/img/logo.png").read_bytes())
+            page = (self.output_dir / "module1/doc.html").read_text()
+            self.assertIn(f'href="../static/{style}"', page)
+            self.assertIn(f'src="../static/{manifest["js/script.js"]}"', page)
+
+            with patch("docmd.link_asset") as link_asset, patch("docmd.read_static_asset") as read_static_asset:
+                docmd.generate_site()
+            self.assertEqual((link_asset.call_count, read_static_asset.call_count), (0, 0))
+        with patch.object(docmd, "INCREMENTAL", "True"), contextlib.redirect_stdout(io.StringIO()):
+            docmd.generate_site()
+        self.assertFalse((static_dir / style).exists())
+        self.assertFalse((static_dir / "assets.json").exists())
+        self.assertIn('src="../static/js/script.js?v=', (self.output_dir / "module1/doc.html").read_text())
+        self.assertEqual((static_dir / "css/style.css").read_bytes(), Path("static/css/style.css").read_bytes())
+        self.assertEqual(docmd.minify_css('a > b ,c {\n  color : red ;\n  content: " ; }" ; /* x */\n}'),
+                         'a>b,c{color : red;content: " ; }"}')
+
+    def test_reproducible_output(self):
+        """Test that pages are dated by their sources, so that two builds at other dates give the same tree."""
+        def snapshot():
+            return {str(p.relative_to(self.output_dir)): p.read_bytes()
+                    for p in sorted(self.output_dir.rglob("*")) if p.is_file() and p.name != docmd.BUILD_INFO_FILE}
+        os.utime(Path(self.include_paths[0]["path"]) / "readme.md", (1700000000, 1700000000))
+        trees = []
+        for day in (1, 2):
+            build_date = datetime(2024, 1, day, 12, 0, 0)
+            date_tag_human = build_date.strftime("%Y-%m-%d at %H:%M:%S")
+            with patch.multiple(docmd, REPRODUCIBLE="True", BUILD_DATE=build_date, DATE_TAG_HUMAN=date_tag_human,
+                                FOOTER=docmd.get_footer(date_tag_human)), contextlib.redirect_stdout(io.StringIO()):
+                docmd.generate_site()
+            trees.append(snapshot())
+            build_info = json.loads((self.output_dir / docmd.BUILD_INFO_FILE).read_text())
+            self.assertEqual(build_info["date"], build_date.isoformat())
+        self.assertEqual(trees[0], trees[1])
+        page = (self.output_dir / "readme.html").read_text()
+        self.assertIn("Last updated on 2023-11-14 at 22:13:20 UTC", page)
+        self.assertNotIn("2024-01-0", page)
+
+        with patch.multiple(docmd, REPRODUCIBLE="True", SOURCE_DATE_EPOCH="1600000000"), contextlib.redirect_stdout(io.StringIO()):
+            docmd.generate_site()
+        self.assertIn("Last updated on 2020-09-13 at 12:26:40 UTC", (self.output_dir / "readme.html").read_text())
+
+    def test_paginated_folder_index(self):
+        """Test folder indexes split into pages with stable URLs, the table layout and the removal of extra pages."""
+        module1 = Path(self.include_paths[0]["path"]) / "module1"
+        for name in ("api1", "api2"):
+            (module1 / f"{name}.md").write_text(f"# {name}")
+        index_dir = self.output_dir / "module1"
+        real_stat = os.stat
+        stat_calls = []
+        def counting_stat(path, *args, **kwargs):
+            stat_calls.append(os.fspath(path))
+            return real_stat(path, *args, **kwargs)
+        with patch.multiple(docmd, FOLDER_INDEX_PAGE_SIZE=2, FOLDER_INDEX_LAYOUT="table", INCREMENTAL="True"), \
+             contextlib.redirect_stdout(io.StringIO()):
+            with patch("os.stat", counting_stat):
+                docmd.generate_site()
+            # The table reuses the stat of the sources by the build.
+            self.assertEqual(stat_calls.count(str(module1 / "api1.md")), 1)
+            first, second = (index_dir / "index.html").read_text(), (index_dir / "index-2.html").read_text()
+            self.assertFalse((index_dir / "index-3.html").exists())
+            self.assertEqual(first.count("<tr><td>"), 2)
+            self.assertEqual(second.count("<tr><td>"), 1)
+            self.assertIn("<td>6 B</td>", first + second)
+            self.assertIn("href='index-2.html'>Next</a>", first)
+            self.assertIn("href='index.html'>Previous</a>", second)
+            self.assertIn('class="nav-link active current" href="index.html"', second)
+        with patch.object(docmd, "INCREMENTAL", "True"), contextlib.redirect_stdout(io.StringIO()):
+            docmd.generate_site()
+        self.assertFalse((index_dir / "index-2.html").exists())
+        self.assertEqual((index_dir / "index.html").read_text().count("<li><a href='api"), 2)
+        self.assertEqual(docmd.format_file_size(1536), "1.5 KB")
+
+    def test_guarded_sources(self):
+        """Test that files over MAX_FILE_SIZE or CONVERT_TIMEOUT get a fallback page and are listed in the build report."""
+        src1 = Path(self.include_paths[0]["path"])
+        (src1 / "huge.md").write_text("# Huge\n\n<b>" + "line\n" * 120000)
+        (src1 / "slow.md").write_text("*a* " * 30000)  # Minutes of Python-Markdown for 120 KB.
+        report = self.test_dir / "report.json"
+        with patch.multiple(docmd, MAX_FILE_SIZE=500000, CONVERT_TIMEOUT=1, BUILD_REPORT=str(report), SEARCH="True",
+                            INCREMENTAL="True"), contextlib.redirect_stdout(io.StringIO()) as output:
+            docmd.generate_site()
+            # Guarded pages have no search entry, and are not converted again for it.
+            docmd.generate_site()
+        self.assertIn("Incremental build: 0 changed source(s), 0 page(s) rendered.", output.getvalue())
+        page = (self.output_dir / "huge.html").read_text()
+        self.assertIn("<pre># Huge\n\n&lt;b&gt;line\nline\n", page)
+        self.assertIn("larger than MAX_FILE_SIZE (600011 bytes)", page)
+        self.assertIn("<h1>README at root</h1>", (self.output_dir / "readme.html").read_text())
+        guarded = json.loads(report.read_text())["guarded"]
+        self.assertEqual(sorted(Path(path).name for path in guarded), ["huge.md", "slow.md"])
+        self.assertIn("longer than 1s", guarded[str(src1 / "slow.md")])
+        self.assertIsNone(docmd.CONVERT_GUARD)
+
+        with patch.multiple(docmd, MAX_FILE_SIZE=500000, MAX_FILE_POLICY="copy"), contextlib.redirect_stdout(io.StringIO()):
+            docmd.generate_site()
+        page = (self.output_dir / "huge.html").read_text()
+        self.assertIn("<a href='huge.md'>huge.md</a>", page)
+        self.assertNotIn("<pre>", page)
+
+        self.assertEqual(docmd.BuildConfig.from_env({"MAX_FILE_POLICY": "Skip"}).settings["MAX_FILE_POLICY"], "skip")
+        with self.assertRaisesRegex(ValueError, "Invalid MAX_FILE_POLICY 'cpoy'"):
+            docmd.BuildConfig.from_env({"MAX_FILE_POLICY": "cpoy"})
+
+    def test_parallel_build_matches_serial(self):
+        """Test that a parallel build produces the same files as a serial one."""
+        def snapshot():
+            return {str(p.relative_to(self.output_dir)): p.read_bytes()
+                    for p in sorted(self.output_dir.rglob("*")) if p.is_file()}
+        with patch.object(docmd, "JOBS", "1"):
+            docmd.generate_site()
+        serial = snapshot()
+        with patch.object(docmd, "JOBS", "2"):
+            docmd.generate_site()
+        self.assertEqual(snapshot(), serial)
+
+    def test_get_pages_links_state_isolated(self):
+        """Test that memoized navigation never leaks the active state between pages."""
+        _, hierarchy = docmd.scan_markdown_files(self.include_paths, docmd.EXCLUDE_PATHS)
+        first = docmd.get_pages_links(".", hierarchy, None, "readme.html")
+        second = docmd.get_pages_links(".", hierarchy, None, "extra.html")
+        def flagged(pages):
+            flags = [(p["ref_path"], p["is_current"]) for p in pages if p["is_active"]]
+            flags += [(s["ref_path"], s["is_current"]) for p in pages for s in p["sub_pages"] if s["is_active"]]
+            return sorted(flags)
+        self.assertEqual(flagged(first), [("Source1/index.html", False), ("readme.html", True)])
+        self.assertEqual(flagged(second), [("Source2/index.html", False), ("extra.html", True)])
+        self.assertEqual([p["rel_path"] for p in first], [p["rel_path"] for p in second])
+        self.assertEqual(docmd.get_relative_path("module1/doc.html", "module2/Sujet"), "../../module1/doc.html")
+        self.assertEqual(docmd.get_relative_path("index.html", "module1"), "../index.html")
+
+    def test_compact_page_model(self):
+        """Test that each file has a single record, linked to its folder by index."""
+        md_files, hierarchy = docmd.scan_markdown_files(self.include_paths, docmd.EXCLUDE_PATHS)
+        subs = [sub for page in hierarchy for sub in page.sub_pages]
+        self.assertEqual({id(sub) for sub in subs}, {id(f) for f in md_files})
+        for sub in subs:
+            self.assertIn(sub, hierarchy[sub.parent_index].sub_pages)
+        deep = next(f for f in md_files if f.title == "deep")
+        self.assertEqual(hierarchy[deep.parent_index]["rel_path"], "module2/Sujet/Sous-sujet/index.html")
+        self.assertEqual((deep["parent"], deep.get("missing")), ("module2/Sujet/Sous-sujet", None))
+        self.assertFalse(hasattr(deep, "__dict__"))
+
+        links = docmd.get_pages_links("module1", hierarchy, None, "module1/doc.html")
+        link = next(link for link in links if link.ref_path == "module1/index.html")
+        self.assertIn(link.page, hierarchy)
+        self.assertEqual((link.rel_path, link.is_active, link.is_current), ("index.html", True, False))
+        self.assertEqual([(s["rel_path"], s.is_current) for s in link.sub_pages], [("doc.html", True)])
+
+    def test_sources_read_once(self):
+        """Test that each source is read a single time to be copied, hashed and converted."""
+        real_open = open
+        opened = []
+        def tracking_open(file, *args, **kwargs):
+            opened.append(str(file))
+            return real_open(file, *args, **kwargs)
+        with patch("builtins.open", tracking_open):
+            docmd.generate_site()
+        for project in self.include_paths:
+            for md_file in Path(project["path"]).rglob("*.md"):
+                self.assertEqual(opened.count(str(md_file)), 1, md_file)
+
+        # Saving identical content leaves the destination untouched.
+        md_file = Path(self.include_paths[0]["path"]) / "module1" / "doc.md"
+        saved = self.output_dir / "module1" / "doc.md"
+        saved_mtime = saved.stat().st_mtime_ns
+        docmd.save_md_file(md_file, self.output_dir, Path(self.include_paths[0]["path"]), md_file.read_bytes())
+        self.assertEqual(saved.stat().st_mtime_ns, saved_mtime)
+
+    def test_background_writers(self):
+        """Test the bounded writer queue, atomic writes and the report of write errors."""
+        with patch.multiple(docmd, WRITERS=2, WRITE_QUEUE_DEPTH=1, PREFETCH_DEPTH=2):
+            docmd.generate_site()
+            self.assertEqual(check_generated_files(self.output_dir), [])
+            self.assertEqual([p for p in self.output_dir.rglob("*.tmp")], [])
+
+            # Incremental builds remove the temporary files of an interrupted build.
+            stale = self.output_dir / "module1/.index.html.123.456.tmp"
+            with patch.object(docmd, "INCREMENTAL", "True"):
+                docmd.generate_site()
+                stale.write_bytes(b"partial")
+                docmd.generate_site()
+            self.assertFalse(stale.exists())
+
+            real_write = docmd.write_file_atomic
+            def failing_write(file_path, data):
+                if Path(file_path).name == "deep.html":
+                    raise OSError("disk full")
+                real_write(file_path, data)
+            with patch("docmd.write_file_atomic", failing_write):
+                with self.assertRaisesRegex(OSError, "deep.html"):
+                    docmd.generate_site()
+            self.assertIsNone(docmd.WRITE_QUEUE)
+
+    def test_client_nav_mode(self):
+        """Test the shared client-side navigation with its breadcrumb fallback."""
+        with patch.object(docmd, "NAV_MODE", "client"), patch.object(docmd, "INCREMENTAL", "True"):
+            docmd.generate_site()
+            with open(self.output_dir / "static/js/nav.js", "r", encoding="utf-8") as f:
+                nav_script = f.read()
+            self.assertTrue(nav_script.startswith("window.DOCMD_NAV="))
+            self.assertIn('"module2/Sujet/Sous-sujet/deep.html"', nav_script)
+
+            with open(self.output_dir / "module2/Sujet/Sous-sujet/deep.html", "r", encoding="utf-8") as f:
+                content = f.read()
+            self.assertNotIn('class="nav-link', content)
+            self.assertIn('data-current-page="module2/Sujet/Sous-sujet/deep.html"', content)
+            self.assertIn('data-root="../../.."', content)
+            self.assertIn('href="../../../Source1/index.html"', content)
+            self.assertIn('href="../../index.html"', content)
+            nav_version = hashlib.sha256(nav_script.encode("utf-8")).hexdigest()[:10]
+            self.assertIn(f'src="../../../static/js/nav.js?v={nav_version}"', content)
+
+            # The pages are kept as long as the navigation does not change.
+            readme_mtime = (self.output_dir / "readme.html").stat().st_mtime_ns
+            docmd.generate_site()
+            self.assertEqual((self.output_dir / "readme.html").stat().st_mtime_ns, readme_mtime)
+
+            # Adding a page links every page to the new version of nav.js.
+            (self.test_dir / "src1/module1/new.md").write_text("# New doc")
+            docmd.generate_site()
+            self.assertTrue((self.output_dir / "module1/new.html").exists())
+            with open(self.output_dir / "static/js/nav.js", "r", encoding="utf-8") as f:
+                nav_script = f.read()
+            self.assertIn('"module1/new.html"', nav_script)
+            nav_version = hashlib.sha256(nav_script.encode("utf-8")).hexdigest()[:10]
+            with open(self.output_dir / "readme.html", "r", encoding="utf-8") as f:
+                self.assertIn(f'src="static/js/nav.js?v={nav_version}"', f.read())
+
+    def test_build_report_and_quiet_mode(self):
+        """Test the JSON build report and the progress line of the quiet mode."""
+        report_file = self.test_dir / "report.json"
+        output = io.StringIO()
+        with patch.multiple(docmd, BUILD_REPORT=str(report_file), QUIET="True"), contextlib.redirect_stdout(output):
+            docmd.generate_site()
+        self.assertNotIn(" Generated:", output.getvalue())
+        self.assertIn(" pages: 5/5", output.getvalue())
+
+        with open(report_file, "r", encoding="utf-8") as f:
+            report = json.load(f)
+        self.assertEqual([p["name"] for p in report["phases"]], ["scan", "static", "sources", "indexes", "root_index", "manifest"])
+        pages = {stats["page"]: stats for stats in report["pages"]}
+        self.assertIn("module1/index.html", pages)
+        self.assertIn("index.html", pages)
+        for timer in ("read", "parse", "nav", "render", "write", "output_bytes"):
+            self.assertGreater(pages["module1/doc.html"][timer], 0)
+        self.assertEqual(report["totals"]["pages"], len(report["pages"]))
+
+    def test_benchmark(self):
+        """Test the benchmark tree generator, phase report and regression check."""
+        include_paths = bench_docmd.generate_tree(self.test_dir / "bench", files=12, depth=2, fanout=2, file_size=300, projects=2)
+        self.assertEqual(len(include_paths), 2)
+        self.assertEqual(sum(len(list(Path(p["path"]).rglob("*.md"))) for p in include_paths), 12)
+
+        results = bench_docmd.run_benchmark(include_paths, self.test_dir / "bench_docs")
+        self.assertEqual([p["name"] for p in results["phases"]], ["scan", "static", "sources", "indexes", "root_index", "manifest"])
+        self.assertGreater(results["output_bytes"], 0)
+        self.assertEqual(docmd.OUTPUT_DIR, self.output_dir)
+        for phase in results["phases"]:
+            if phase["peak_rss_kb"] is not None:
+                self.assertTrue(0 <= phase["rss_growth_kb"] <= phase["peak_rss_kb"])
+
+        slower = dict(results, total_seconds=results["total_seconds"] * 2)
+        self.assertEqual(bench_docmd.compare_results(results, results), [])
+        self.assertEqual([r["name"] for r in bench_docmd.compare_results(slower, results)], ["total_seconds"])
+
 if __name__ == "__main__":
     unittest.main()